@@ -1,14 +1,27 @@
 import tkinter
 from tkinter import Event, Frame, Label
-from PIL import Image, ImageTk, ExifTags
-from src.gmail_api import GmailApi
-from src.firebase_storage import FirebaseStorage
-from os import listdir, path, getenv
+from PIL import Image
+from os import path, getenv
+from importlib import import_module
+from threading import Thread
+from time import monotonic
 import src.helper as hlpr
 from src.logger import Logger
-from src.weather_com import WeatherDotCom
-from threading import Thread
-import cv2
+from src.prefetch import Prefetcher
+from src.rendition_cache import RenditionCache
+from src.video_stream import VideoStream
+from src.video_cache import VideoFrameCache
+from src.presentation_clock import PresentationClock
+from src.media_catalog import MediaCatalog, MediaStatus
+from src.periodic_worker import PeriodicWorker
+from src.ingest import IngestPipeline
+from src.metrics import metrics
+from src.playlist import Playlist, PlaylistItems, PlaylistOrder
+from src.storage_manager import StorageManager
+from src.dedup import Deduplicator
+from src.transition import Crossfade
+from src.frame_presenter import FramePresenter
+from queue import Queue, Empty
 import numpy as np
 from src.zoom import Zoom, ZoomAction, ZoomNavigationDirections
 from dotenv import load_dotenv
@@ -17,6 +30,8 @@ load_dotenv()
 
 GMAIL_LABEL_ID = getenv("GMAIL_LABEL_ID")
 PROJECT_PATH = getenv("PROJECT_PATH")
+METRICS_PORT = getenv("METRICS_PORT")  # local metrics endpoint, disabled if not set
+PLAYLIST_ORDER = getenv("PLAYLIST_ORDER", PlaylistOrder.DATE.value)  # date or shuffle
 
 # Zoom
 VERSION = "6.0.0"
@@ -24,10 +39,50 @@ VERSION = "6.0.0"
 MAIL_REFRESH_INTERVAL_MS = 1000 * 60 * 30  # 30min
 SLIDESHOW_INTERVAL_MS = 1000 * 10  # 10s
 WEATHER_REFRESH_INTERVAL_MS = 1000 * 60 * 15  # 15min
+WORKER_RESULTS_POLL_INTERVAL_MS = 500
+ZOOM_REFINE_DELAY_MS = 100  # zoom rendered again while in low quality
+GMAIL_DOWNLOAD_WORKERS = 4
+GMAIL_ATTACHMENT_CHUNK_BYTES = 1024 * 1024  # 1MB, memory used per attachment download
+FIREBASE_DOWNLOAD_WORKERS = 4
+METRICS_DUMP_INTERVAL_MS = 1000 * 60  # 1min
+METRICS_FILE_NAME = "metrics.json"
+PLAYLIST_SAVE_INTERVAL_MS = 1000 * 60  # 1min, show counts and position saved in catalog
+PLAYLIST_NO_REPEAT_WINDOW = 200  # shuffle: slides not shown again within
+
+PREFETCH_DEPTH = 2  # next slides decoded in advance
+PREFETCH_WORKERS = 2
+PREFETCH_MAX_BYTES = 1024 * 1024 * 64  # 64MB
+RENDITION_CACHE_MAX_BYTES = 1024 * 1024 * 512  # 512MB
+VIDEO_BUFFER_SIZE = 8  # decoded frames kept ahead
+VIDEO_MAX_FPS = 30  # frames dropped above, and when rendering is late
+VIDEO_WAIT_DECODER_MS = 5  # retry delay when next frame isn't decoded yet
+VIDEO_CACHE_MAX_BYTES = 1024 * 1024 * 1024 * 2  # 2GB
+VIDEO_CACHE_MAX_VIDEO_BYTES = 1024 * 1024 * 512  # 512MB, longer videos are decoded at each play
+ATTACHMENTS_MAX_BYTES = 1024 * 1024 * 1024 * 8  # 8GB, old files removed above
+ATTACHMENTS_HIGH_WATERMARK = 0.9  # eviction starts above max * high
+ATTACHMENTS_LOW_WATERMARK = 0.75  # and stops under max * low
+STORAGE_PINNED_WINDOW = 10  # slides around the current one never evicted
+DEDUP_MAX_DISTANCE = 3  # bits of perceptual hash that may differ between duplicates
+DEDUP_DELETE_FILES = False  # duplicates only removed from playlist if False
+DEDUP_MAX_FILES = 200  # files hashed per sync, next sync runs at once if there are more
+INGEST_WORKERS = None  # processes validating new files, one per core if None
+INGEST_MAX_FILES = 200  # files validated per sync, next sync runs at once if there are more
+STARTUP_FIRST_SLIDE_BUDGET_MS = 3000  # first slide on screen, catalog, network and heavy modules loaded after
+PRELOAD_MODULES = ("cv2",)  # imported in background once the first slide is shown
+
+TRANSITION_DURATION_MS = 600  # crossfade between photos, 0 to disable
+TRANSITION_FPS = 20
+TRANSITION_MIN_STEPS = 3  # hard cut if rendering can't show as many frames in TRANSITION_DURATION_MS
 
 BACKGROUND_NEW_IMAGE = "green"
 BORDER_SIZE_NEW_IMAGE = 3
 
+SYNC_WORKER = "sync"
+WEATHER_WORKER = "weather"
+METRICS_WORKER = "metrics"
+PLAYLIST_WORKER = "playlist"
+STARTUP_WORKER = "startup"
+
 RESTART_SLIDESHOW = "RESTART_SLIDESHOW"
 PREVIOUS_IMAGE = "PREVIOUS_IMAGE"
 NEXT_IMAGE = "NEXT_IMAGE"
@@ -38,168 +93,367 @@ class SlideShow():
     NO_IMAGE_LABEL = "No photo"
 
     def __init__(self):
+        self.started_at = monotonic()
         self.PROJECT_PATH = PROJECT_PATH
-        self.video_frames, self.index_video_frame = [], -1
+        self.video_stream, self.video_pass = None, -1
         self.logger = Logger(self.__class__.__name__)
         self.logger.info("__init__", f"Slideshow Version[{VERSION}]")
         self.is_paused = False
         self.label_pause = None
-        self.list_images = []
         self.image_name = None
         self.label = None
         self.label_image = None
         self.canvas = None
         self.frame = None
         self.identifier_change_image = None
+        self.identifier_zoom_refine = None
+        self.identifier_transition = None
+        self.transition_image = None
+        self.clock = PresentationClock(SLIDESHOW_INTERVAL_MS)
         self.main_window, self.width, self.height = self.__create_main_window()
+        hlpr.create_attachments_path(self.PROJECT_PATH)
+        # migration, cache indexes and playlist loaded after the first slide, see __load_catalog
+        self.catalog = MediaCatalog(self.PROJECT_PATH, migrate=False)
+        self.rendition_cache = RenditionCache(self.PROJECT_PATH, self.width, self.height, RENDITION_CACHE_MAX_BYTES,
+                                              load_index=False)
+        self.video_cache = VideoFrameCache(self.PROJECT_PATH, self.width, self.height, VIDEO_CACHE_MAX_BYTES,
+                                           VIDEO_CACHE_MAX_VIDEO_BYTES, load_index=False)
+        self.prefetcher = Prefetcher(self.__load_screen_image, PREFETCH_DEPTH, PREFETCH_MAX_BYTES,
+                                     self.width * self.height * 3, PREFETCH_WORKERS)
         self.zoom_helper = Zoom()
-        self.weatherCom = WeatherDotCom("Hussar")
-        self.gmail_api = GmailApi(self.PROJECT_PATH, GMAIL_LABEL_ID)
-        self.firebase = FirebaseStorage(self.PROJECT_PATH)
-        self.list_images = self.__get_saved_images()
-        self.logger.info("__init___", f"{len(self.list_images)} images taken from cache")
-
-    def __get_index(self, item_to_find, items):
-        try:
-            return items.index(item_to_find)
-        except ValueError:
-            return -1
-
-    def __play_video(self, frame_delay_ms, time_start_ms):
+        self.crossfade = Crossfade(self.width, self.height)
+        self.presenter = FramePresenter(self.label_image, self.width, self.height)
+        # created on worker threads: network and client libraries don't delay the first slide
+        self.weatherCom = None
+        self.gmail_api, self.firebase = None, None
+        self.storage_manager = StorageManager(self.PROJECT_PATH, self.catalog, ATTACHMENTS_MAX_BYTES,
+                                              ATTACHMENTS_HIGH_WATERMARK, ATTACHMENTS_LOW_WATERMARK)
+        self.ingest = IngestPipeline(self.PROJECT_PATH, self.catalog, self.rendition_cache, INGEST_WORKERS)
+        self.deduplicator = Deduplicator(self.catalog, DEDUP_MAX_DISTANCE, DEDUP_DELETE_FILES)
+        self.playlist = Playlist(self.catalog, PlaylistOrder(PLAYLIST_ORDER), PLAYLIST_NO_REPEAT_WINDOW,
+                                 PlaylistItems([]))
+        self.is_playlist_loaded = False
+        self.worker_results = Queue()
+        self.sync_worker = PeriodicWorker(SYNC_WORKER, self.__check_new_files, MAIL_REFRESH_INTERVAL_MS / 1000,
+                                          self.worker_results)
+        self.weather_worker = PeriodicWorker(WEATHER_WORKER, self.__get_weather,
+                                             WEATHER_REFRESH_INTERVAL_MS / 1000, self.worker_results)
+        metrics_file = path.join(self.PROJECT_PATH, METRICS_FILE_NAME)
+        self.metrics_worker = PeriodicWorker(METRICS_WORKER, lambda: metrics.dump(metrics_file),
+                                             METRICS_DUMP_INTERVAL_MS / 1000, self.worker_results)
+        self.playlist_worker = PeriodicWorker(PLAYLIST_WORKER, self.playlist.save, PLAYLIST_SAVE_INTERVAL_MS / 1000,
+                                              self.worker_results)
+
+    def __close_video(self):
+        if self.video_stream:
+            self.video_stream.close()
+            if self.clock.dropped_frames > 0:
+                self.logger.debug("__close_video", f"{self.clock.dropped_frames} frame(s) dropped")
+            self.clock.stop_video()
+        self.video_stream, self.video_pass = None, -1
+
+    def __play_video(self):
         # pause non pris en compte car en pause = on ne defile plus le slideshow
-        if self.video_frames:
-            nb_frames = len(self.video_frames)
-            if nb_frames > 0:
+        if self.video_stream:
+            frames_due = self.clock.get_video_frames_due()
+            img_array, video_pass = None, -1
+            if frames_due > 0:
+                # frames late are dropped to keep real time playback
+                img_array, video_pass = self.video_stream.read(frames_due - 1)
+            if img_array is not None:
+                self.clock.on_video_frames_presented(frames_due)
+                metrics.increment("video_frames_presented")
+                if frames_due > 1:
+                    metrics.increment("video_frames_dropped", frames_due - 1)
                 if self.label_image["text"] == self.NO_IMAGE_LABEL:
                     self.label_image["text"] = None
-                self.index_video_frame = self.index_video_frame + 1
+                is_new_pass = video_pass != self.video_pass
+                self.video_pass = video_pass
                 # pause pris en compte ici, car on joue la video meme si en pause
-                if not self.is_paused and self.index_video_frame >= nb_frames and (
-                        hlpr.get_current_time() - time_start_ms > SLIDESHOW_INTERVAL_MS):
+                if not self.is_paused and is_new_pass and video_pass > 0 and (
+                        self.clock.get_video_elapsed_ms() > SLIDESHOW_INTERVAL_MS):
                     self.logger.debug("__play_video", "playing video enough, changing image")
-                    del self.video_frames
-                    self.video_frames = []
-                    self.index_video_frame = -1
+                    self.__close_video()
                     self.__change_image()
                     return
-                if self.index_video_frame < 0 or self.index_video_frame >= nb_frames:
-                    self.index_video_frame = 0
-
-                img_array = self.video_frames[self.index_video_frame]
-                pilImage = Image.fromarray(img_array)
 
-                self.showPIL(pilImage)
-            else:
+                with self.clock.measure(PresentationClock.VIDEO_FRAME), metrics.span("video_frame"):
+                    self.presenter.present_array(img_array)
+            elif frames_due > 0 and self.video_stream.is_finished():
                 # no frames, calling change image to skip video
-                self.logger.info("__play_video", "No frames")
+                self.logger.info("__play_video", "No frames", self.video_stream.error)
                 if self.label_image["text"] != self.NO_IMAGE_LABEL:
                     self.label_image["text"] = self.NO_IMAGE_LABEL
+                self.__close_video()
                 self.__change_image()
                 return
 
-        self.identifier_change_image = self.main_window.after(frame_delay_ms,
-                                                              lambda: self.__play_video(frame_delay_ms, time_start_ms))
+            if frames_due > 0 and img_array is None:
+                delay_ms = VIDEO_WAIT_DECODER_MS
+            else:
+                delay_ms = self.clock.get_video_frame_delay_ms()
+            self.identifier_change_image = self.main_window.after(delay_ms, self.__play_video)
 
-    def __change_image(self, action: str = None):
+    def __change_image(self, action: str = None, on_time: bool = False):
+        """
+            :param on_time: True when called by the slideshow timer
+        """
         self.__set_label_time(hlpr.get_time_in_alberta())
         call_again = True
+        slide_shown = False
 
         if not self.is_paused or action in LIST_ACTIONS:
             self.zoom_helper.reset()
-            nb_images = len(self.list_images)
-            if nb_images > 0:
+            self.__stop_transition()
+            self.__close_video()
+            if len(self.playlist) > 0:
                 if self.label_image["text"] == self.NO_IMAGE_LABEL:
                     self.label_image["text"] = None
-                next_index = -1
                 if action in LIST_ACTIONS:
                     if self.identifier_change_image:
                         self.main_window.after_cancel(self.identifier_change_image)
-                    if action == RESTART_SLIDESHOW:
-                        next_index = 0
-                    elif action == PREVIOUS_IMAGE:
-                        next_index = self.__get_index(self.image_name, self.list_images) - 1
-                        if next_index < 0:
-                            next_index = nb_images - 1
-                    elif action == NEXT_IMAGE:
-                        next_index = self.__get_index(self.image_name, self.list_images) + 1
-                        if next_index >= nb_images:
-                            next_index = 0
+                if action == RESTART_SLIDESHOW:
+                    self.image_name = self.playlist.restart()
+                elif action == PREVIOUS_IMAGE:
+                    self.image_name = self.playlist.previous()
                 else:
-                    if self.image_name:
-                        next_index = self.__get_index(self.image_name, self.list_images) + 1
-
-                if next_index < 0 or next_index >= nb_images:
-                    next_index = 0
+                    self.image_name = self.playlist.next()
+                self.playlist.on_shown(self.image_name)
 
-                self.image_name = self.list_images[next_index]
                 if hlpr.is_valid_video_file(self.image_name):
-                    del self.video_frames
-                    self.video_frames = []
-                    self.index_video_frame = -1
-                    err, frames, fps = hlpr.get_video_infos(self.image_name)
-                    if not err and frames and fps > 0:
-                        self.video_frames = frames
-                        del frames
-                        # reducing delay by 4 for fluidity reason on raspberry
-                        self.__play_video(int((1000 / fps) * 0.25), hlpr.get_current_time())
+                    self.video_stream = VideoStream(self.image_name, self.width, self.height, VIDEO_BUFFER_SIZE,
+                                                    VIDEO_MAX_FPS, self.video_cache,
+                                                    self.catalog.get_metadata(self.image_name))
+                    err, fps = self.video_stream.start()
+                    if not err and fps > 0:
+                        self.clock.start_video(fps)
+                        self.__play_video()
                         call_again = False
                     else:
+                        self.__close_video()
                         self.logger.error("__change_image",
                                           "error getting video infos[" + path.basename(self.image_name) + "]", err)
                 else:
-                    pilImage = self.__get_image(self.image_name)
-                    if not pilImage:
-                        pilImage = Image.open(self.image_name)
-                    self.showPIL(pilImage)
-                    if self.is_paused:
-                        self.zoom_helper.init(self.get_image_array())
+                    with self.clock.measure(PresentationClock.PHOTO), metrics.span("slide_change"):
+                        pilImage = self.prefetcher.take(self.image_name)
+                        metrics.increment("prefetch_misses" if pilImage is None else "prefetch_hits")
+                        if not pilImage:
+                            pilImage = self.__get_screen_image(self.image_name)
+                        if not pilImage:
+                            pilImage = self.__get_image(self.image_name)
+                        if not pilImage:
+                            pilImage = self.__open_image(self.image_name)
+                        if pilImage:
+                            self.__show_slide(pilImage)
+                    if pilImage:
+                        self.clock.start_slide(on_time and action is None)
+                        metrics.increment("slides")
+                        slide_shown = True
+                        if self.is_paused:
+                            self.zoom_helper.init(self.get_image_array(), self.image_name)
 
                 self.__set_frame_border(self.image_name)
+                self.__prefetch_around()
+            elif not self.is_playlist_loaded:
+                # first slide kept until playlist is loaded
+                if action in LIST_ACTIONS and self.identifier_change_image:
+                    self.main_window.after_cancel(self.identifier_change_image)
             else:
                 self.logger.info("__change_image", "No images")
                 if self.label_image["text"] != self.NO_IMAGE_LABEL:
                     self.label_image["text"] = self.NO_IMAGE_LABEL
         if call_again:
-            self.identifier_change_image = self.main_window.after(SLIDESHOW_INTERVAL_MS, self.__change_image)
-
-    def __get_saved_images(self, nombre_maxi=30):
-        img_folder = hlpr.get_path_attachments(self.PROJECT_PATH)
-        img_list = listdir(img_folder)
-        # sort by date descending
-        img_list.sort(key=lambda x: x.split("_")[1] if x and len(x.split("_")) > 2 else "000000000000000", reverse=True)
-        tmp_images = []
-        for i in range(len(img_list)):
-            if hlpr.get_file_extension_if_valid(img_list[i]):
-                tmp_images.append(path.join(img_folder, img_list[i]))
-            if len(tmp_images) >= nombre_maxi:
-                break
+            delay_ms = self.clock.get_slide_delay_ms() if slide_shown else SLIDESHOW_INTERVAL_MS
+            self.identifier_change_image = self.main_window.after(delay_ms,
+                                                                  lambda: self.__change_image(on_time=True))
+
+    def __prefetch_around(self):
+        """
+            Decodes next slides and the previous one in background
+        """
+        if len(self.playlist) <= 1:
+            self.prefetcher.clear()
+            return
+        next_files = self.playlist.peek_next(PREFETCH_DEPTH)
+        previous_file = self.playlist.peek_previous()
+        self.prefetcher.schedule([f for f in next_files if hlpr.is_valid_image_file(f)],
+                                 previous_file if previous_file and hlpr.is_valid_image_file(previous_file) else None)
 
-        return tmp_images
+    def __show_first_slide(self) -> bool:
+        """
+            Shows the slide current when the slideshow stopped if its rendition is cached,
+            before catalog and playlist are loaded
+            Returns False if there is none
+        """
+        position = self.catalog.get_state(Playlist.STATE_POSITION)
+        if not position:
+            return False
+        file_path = path.join(hlpr.get_path_attachments(self.PROJECT_PATH), position)
+        if not hlpr.is_valid_image_file(file_path):
+            return False
+        with self.clock.measure(PresentationClock.PHOTO), metrics.span("slide_change"):
+            pil_image = self.rendition_cache.get(file_path)
+            if pil_image is None:
+                return False
+            self.presenter.present_image(pil_image)
+        self.image_name = file_path
+        self.playlist.start_at(file_path)
+        self.__set_frame_border(file_path)
+        self.clock.start_slide(False)
+        self.identifier_change_image = self.main_window.after(self.clock.get_slide_delay_ms(),
+                                                              lambda: self.__change_image(on_time=True))
+        return True
+
+    def show_startup_slide(self) -> bool:
+        """
+            Shows and draws the first slide, from rendition cache if possible
+            Returns False if catalog and playlist had to be loaded before
+        """
+        is_first_slide_cached = self.__show_first_slide()
+        if not is_first_slide_cached:
+            # nothing to show without the playlist
+            self.playlist.update(self.__load_catalog())
+            self.playlist.restore_position()
+            self.is_playlist_loaded = True
+            self.__change_image()
+        # first slide drawn before workers compete for CPU
+        self.main_window.update()
+        return is_first_slide_cached
+
+    def __load_catalog(self) -> PlaylistItems:
+        """
+            Startup work deferred after the first slide: catalog migration, cache indexes, playlist
+        """
+        with metrics.span("startup_load_catalog"):
+            self.catalog.migrate()
+            self.rendition_cache.load_index()
+            self.video_cache.load_index()
+            items = Playlist.build_items(self.catalog)
+        self.logger.info("__load_catalog", f"{len(items)} images taken from cache")
+        return items
+
+    def __load_catalog_in_background(self):
+        """
+            Runs on startup thread, sync starts once catalog is loaded
+        """
+        try:
+            self.worker_results.put((STARTUP_WORKER, self.__load_catalog()))
+        except Exception as e:
+            self.logger.error("__load_catalog_in_background", "can't load catalog", e)
+        self.sync_worker.start()
+
+    def __create_sync_clients(self):
+        """
+            Runs on sync worker thread, Google client libraries imported and clients created at first sync,
+            each client created again next sync if it failed
+        """
+        if self.gmail_api is None:
+            try:
+                with metrics.span("sync_clients_gmail"):
+                    from src.gmail_api import GmailApi
+                    self.gmail_api = GmailApi(self.PROJECT_PATH, GMAIL_LABEL_ID, self.catalog,
+                                              GMAIL_DOWNLOAD_WORKERS, GMAIL_ATTACHMENT_CHUNK_BYTES)
+            except Exception as e:
+                self.logger.error("__create_sync_clients", "can't create Gmail client", e)
+        if self.firebase is None:
+            try:
+                with metrics.span("sync_clients_firebase"):
+                    from src.firebase_storage import FirebaseStorage
+                    self.firebase = FirebaseStorage(self.PROJECT_PATH, self.catalog, FIREBASE_DOWNLOAD_WORKERS)
+            except Exception as e:
+                self.logger.error("__create_sync_clients", "can't create Firebase client", e)
+
+    def __get_weather(self):
+        """
+            Runs on weather worker thread, client created at first call
+        """
+        if self.weatherCom is None:
+            from src.weather_com import WeatherDotCom
+            self.weatherCom = WeatherDotCom("Hussar")
+        return self.weatherCom.get_temp_and_feels_temp()
+
+    def __preload_modules(self):
+        """
+            Imports modules of videos, zoom and transitions in background, not on first use by Tk main thread
+        """
+        for name in PRELOAD_MODULES:
+            try:
+                with metrics.span("preload_" + name):
+                    import_module(name)
+            except Exception as e:
+                self.logger.error("__preload_modules", f"can't import {name}", e)
 
     def __check_new_files(self):
-        self.logger.info("__check_new_files", "checking new mails...")
-        new_images = self.gmail_api.download_new_images()
-        if new_images and len(new_images) > 0:
-            self.logger.info("__check_new_files", f"{len(new_images)} new mail file(s) downloaded")
-            self.list_images = self.__get_saved_images()
-
-        self.logger.info("__check_new_files", "checking new firebase media...")
-        new_files_firebase = self.firebase.download_new_medias()
-        if new_files_firebase and len(new_files_firebase) > 0:
-            self.logger.info("__check_new_files", f"{len(new_files_firebase)} new firebase media(s) downloaded")
-            self.list_images = self.__get_saved_images()
+        """
+            Runs on sync worker thread, returns new playlist if new files were downloaded
+        """
+        self.__create_sync_clients()
+        has_new_files = False
+        if self.gmail_api:
+            self.logger.info("__check_new_files", "checking new mails...")
+            with metrics.span("sync_gmail"):
+                new_images = self.gmail_api.download_new_images()
+            if new_images and len(new_images) > 0:
+                self.logger.info("__check_new_files", f"{len(new_images)} new mail file(s) downloaded")
+                has_new_files = True
+
+        if self.firebase:
+            self.logger.info("__check_new_files", "checking new firebase media...")
+            with metrics.span("sync_firebase"):
+                new_files_firebase = self.firebase.download_new_medias()
+            if new_files_firebase and len(new_files_firebase) > 0:
+                self.logger.info("__check_new_files", f"{len(new_files_firebase)} new firebase media(s) downloaded")
+                has_new_files = True
 
         self.logger.info("__check_new_files", "...checked")
+        # new files, and files downloaded by a previous version
+        files_without_metadata = self.catalog.get_files_without_metadata(INGEST_MAX_FILES)
+        with metrics.span("sync_ingest"):
+            quarantined = self.ingest.run(files_without_metadata)
+        if len(files_without_metadata) >= INGEST_MAX_FILES:
+            # backlog (first run, bulk sync): next batch without waiting for the interval
+            self.sync_worker.trigger()
+        if files_without_metadata:
+            self.logger.info("__check_new_files", f"{len(files_without_metadata)} file(s) validated, "
+                                                  f"{quarantined} quarantined")
+        # files downloaded by a previous version hashed by batches too
+        files_without_hash = self.catalog.get_files_without_hash(DEDUP_MAX_FILES)
+        with metrics.span("sync_dedup"):
+            duplicates = self.deduplicator.run(files_without_hash)
+        if len(files_without_hash) >= DEDUP_MAX_FILES:
+            self.sync_worker.trigger()
+        if duplicates:
+            self.logger.info("__check_new_files", f"{duplicates} duplicate(s) removed from playlist")
+        with metrics.span("sync_storage"):
+            reclaimed_bytes = self.storage_manager.run(self.playlist.get_window(STORAGE_PINNED_WINDOW))
+        if has_new_files or files_without_metadata or duplicates or reclaimed_bytes > 0:
+            return Playlist.build_items(self.catalog)
+        return None
 
-        self.main_window.after(MAIL_REFRESH_INTERVAL_MS, self.__check_new_files)
-
-    def __refresh_weatherV2(self):
-        temp, feels_temp = self.weatherCom.get_temp_and_feels_temp()
+    def __poll_worker_results(self):
+        """
+            Applies results of background workers on Tk main thread
+        """
+        while True:
+            try:
+                name, result = self.worker_results.get_nowait()
+            except Empty:
+                break
+            if name in (SYNC_WORKER, STARTUP_WORKER):
+                # playlist snapshot replaced at once
+                self.playlist.update(result)
+                self.is_playlist_loaded = True
+                metrics.set_gauge("playlist_size", len(result))
+                self.logger.info("__poll_worker_results", f"playlist updated, {len(result)} images")
+            elif name == WEATHER_WORKER:
+                self.__refresh_weatherV2(*result)
+        self.main_window.after(WORKER_RESULTS_POLL_INTERVAL_MS, self.__poll_worker_results)
+
+    def __refresh_weatherV2(self, temp, feels_temp):
         if temp != None:
             self.__set_label_temp(temp)
         if feels_temp != None:
             self.__set_label_feels_temp(feels_temp)
-        self.main_window.after(WEATHER_REFRESH_INTERVAL_MS, self.__refresh_weatherV2)
 
     def __set_label_temp(self, temp: str):
         current_txt = self.label.cget("text")
@@ -224,68 +478,133 @@ class SlideShow():
         self.label.config(text=new_txt)
 
     def __set_frame_border(self, image_name):
-        if hlpr.is_new_image(image_name):
+        if hlpr.is_new_image(image_name, self.catalog.get_timestamp_ms(image_name)):
             self.frame.configure(border=BORDER_SIZE_NEW_IMAGE, background=BACKGROUND_NEW_IMAGE)
         else:
             self.frame.configure(border=0, background="black")
 
     def __get_image(self, filepath) -> Image:
         try:
-            image = Image.open(filepath)
-            orientation = ""
-            for orientation in ExifTags.TAGS.keys():
-                if ExifTags.TAGS[orientation] == 'Orientation':
-                    break
-
-            exif = image._getexif()
-
-            if exif and orientation in exif:
-                if exif[orientation] == 3:
-                    image = image.rotate(180, expand=True)
-                elif exif[orientation] == 6:
-                    image = image.rotate(270, expand=True)
-                elif exif[orientation] == 8:
-                    image = image.rotate(90, expand=True)
-
-            return image
-        except (AttributeError, KeyError, IndexError):
-            # cases: image don't have getexif
-            pass
+            return hlpr.open_image_oriented(filepath, self.width, self.height)
         except Exception as e:
             self.logger.error("__get_image", "exif Exception", e)
 
         return None
 
+    def __open_image(self, filepath) -> Image:
+        """
+            Last fallback, file removed by hand since playlist was built gets MISSING status
+        """
+        try:
+            return Image.open(filepath)
+        except FileNotFoundError:
+            self.logger.warning("__open_image", f"[{path.basename(filepath)}] missing, removed from catalog")
+            self.catalog.set_status(filepath, MediaStatus.MISSING)
+        except Exception as e:
+            self.logger.error("__open_image", f"can't open[{path.basename(filepath)}]", e)
+
+        return None
+
+    def __load_screen_image(self, filepath) -> Image:
+        """
+            Returns image fitted to screen from rendition cache, orientation read from catalog
+        """
+        metadata = self.catalog.get_metadata(filepath)
+        return self.rendition_cache.load(filepath, metadata.orientation if metadata else None)
+
+    def __get_screen_image(self, filepath) -> Image:
+        """
+            Returns image fitted to screen, from rendition cache
+        """
+        try:
+            return self.__load_screen_image(filepath)
+        except Exception as e:
+            self.logger.error("__get_screen_image", "rendition Exception", e)
+
+        return None
+
     def showPIL(self, pil_image: Image):
-        imgWidth, imgHeight = pil_image.size
-        ratio = min(self.width / imgWidth, self.height / imgHeight)
-        imgWidth = int(imgWidth * ratio)
-        imgHeight = int(imgHeight * ratio)
-        pil_image = pil_image.resize((imgWidth, imgHeight), Image.ANTIALIAS)
+        # no-op when image comes from prefetcher, already fitted to screen
+        with metrics.span("resize"):
+            pil_image = hlpr.resize_to_fit(pil_image, self.width, self.height)
+
+        with metrics.span("photo_image"):
+            self.presenter.present_image(pil_image)
+
+    def __show_slide(self, pil_image: Image):
+        """
+            Shows photo with a crossfade from the displayed image,
+            hard cut when paused or when rendering is too slow for the transition
+        """
+        with metrics.span("resize"):
+            pil_image = hlpr.resize_to_fit(pil_image, self.width, self.height)
+        if (TRANSITION_DURATION_MS <= 0 or not self.presenter.has_frame or self.is_paused
+                or not self.clock.is_transition_possible(TRANSITION_DURATION_MS, TRANSITION_MIN_STEPS)):
+            self.showPIL(pil_image)
+            return
+        self.crossfade.start(self.presenter.get_frame(), pil_image)
+        self.transition_image = pil_image
+        self.clock.start_transition(TRANSITION_DURATION_MS, TRANSITION_FPS)
+        self.__play_transition()
+
+    def __play_transition(self):
+        self.identifier_transition = None
+        progress = self.clock.get_transition_progress()
+        if progress >= 1:
+            self.__stop_transition()
+            return
+        with self.clock.measure(PresentationClock.TRANSITION_FRAME), metrics.span("transition_frame"):
+            self.presenter.present_array(self.crossfade.blend(progress))
+        metrics.increment("transition_frames")
+        self.identifier_transition = self.main_window.after(self.clock.get_transition_frame_delay_ms(),
+                                                            self.__play_transition)
 
-        image = ImageTk.PhotoImage(pil_image)
-        self.label_image.image = image
-        self.label_image.configure(image=image)
+    def __stop_transition(self):
+        """
+            Ends running transition, incoming photo is shown
+        """
+        if self.identifier_transition:
+            self.main_window.after_cancel(self.identifier_transition)
+            self.identifier_transition = None
+        if self.transition_image is not None:
+            pil_image, self.transition_image = self.transition_image, None
+            self.clock.stop_transition()
+            self.showPIL(pil_image)
 
     def zoom(self, action: ZoomAction, direction: ZoomNavigationDirections):
         """
             :param action: Zoom/Dezoom
             :param direction: navigation direction
         """
-        cropped = self.zoom_helper.set_zoom(action, direction)
+        if self.identifier_zoom_refine:
+            self.main_window.after_cancel(self.identifier_zoom_refine)
+            self.identifier_zoom_refine = None
+        array_img, complete = self.zoom_helper.render_zoom(action, direction)
 
-        if cropped is None or not cropped.any():
+        if array_img is None or not array_img.any():
             self.logger.info("zoom", "NOT CROPPED")
             return
 
-        array_img = cv2.resize(cropped, (self.zoom_helper.get_width(), self.zoom_helper.get_height()))
-        image = ImageTk.PhotoImage(Image.fromarray(array_img))
-        self.label_image.image = image
-        self.label_image.configure(image=image)
+        self.presenter.present_array(array_img)
+        if not complete:
+            self.identifier_zoom_refine = self.main_window.after(ZOOM_REFINE_DELAY_MS, self.__refine_zoom)
+
+    def __refine_zoom(self):
+        self.identifier_zoom_refine = None
+        if self.is_paused and self.zoom_helper.isReady:
+            self.zoom(None, None)
 
     def onDestroy(self, e):
         self.logger.info("onDestroy", e.widget)
         if not e.widget.master:
+            self.sync_worker.stop()
+            self.weather_worker.stop()
+            self.metrics_worker.stop()
+            self.playlist_worker.stop()
+            self.playlist.save()
+            metrics.stop_server()
+            self.prefetcher.shutdown()
+            self.__close_video()
             exit()
 
     def __create_main_window(self):
@@ -349,25 +668,41 @@ class SlideShow():
 
     def get_image_array(self):
         if self.is_paused and hlpr.is_valid_image_file(self.image_name):
-            pil_image = self.__get_image(self.image_name)
+            pil_image = self.__get_screen_image(self.image_name)
+            if not pil_image:
+                pil_image = self.__get_image(self.image_name)
             if not pil_image:
                 pil_image = Image.open(self.image_name)
-            imgWidth, imgHeight = pil_image.size
-            ratio = min(self.width / imgWidth, self.height / imgHeight)
-            imgWidth = int(imgWidth * ratio)
-            imgHeight = int(imgHeight * ratio)
-            pil_image = pil_image.resize((imgWidth, imgHeight), Image.ANTIALIAS)
+            pil_image = hlpr.resize_to_fit(pil_image, self.width, self.height)
             return np.asarray(pil_image)
 
         return np.array([], dtype=np.uint8)
 
     def start_slideshow(self):
         self.logger.info("start_slideshow", "starting slideshow...")
-        self.__change_image()
-        t_mail = Thread(target=self.__check_new_files)
-        t_mail.start()
-        t_weather = Thread(target=self.__refresh_weatherV2)
-        t_weather.start()
+        is_first_slide_cached = self.show_startup_slide()
+        elapsed_ms = (monotonic() - self.started_at) * 1000
+        metrics.set_gauge("startup_first_slide_ms", round(elapsed_ms))
+        if elapsed_ms > STARTUP_FIRST_SLIDE_BUDGET_MS:
+            self.logger.warning("start_slideshow", f"first slide shown in {elapsed_ms:.0f}ms, "
+                                                   f"budget {STARTUP_FIRST_SLIDE_BUDGET_MS}ms")
+        else:
+            self.logger.info("start_slideshow", f"first slide shown in {elapsed_ms:.0f}ms")
+        if is_first_slide_cached:
+            Thread(target=self.__load_catalog_in_background, name=STARTUP_WORKER, daemon=True).start()
+        else:
+            self.sync_worker.start()
+        Thread(target=self.__preload_modules, name="preload", daemon=True).start()
+        self.__poll_worker_results()
+        self.weather_worker.start()
+        metrics.set_gauge("playlist_size", len(self.playlist))
+        if METRICS_PORT:
+            try:
+                metrics.start_server(int(METRICS_PORT))
+            except Exception as e:
+                self.logger.error("start_slideshow", "can't start metrics endpoint", e)
+        self.metrics_worker.start()
+        self.playlist_worker.start()
         self.logger.info("start_slideshow", "slideshow started")
         self.main_window.mainloop()
 
@@ -377,76 +712,78 @@ class SlideShow():
         return "break"
 
     def onWindowClick(self, e: Event):
+        self.__stop_transition()
         if e and self.width and self.height and self.width > 0 and self.height > 0:
             if self.is_paused and self.zoom_helper.isReady:
                 if e.widget and e.widget._name == "labelPause":
-                    self.logger.info("onWindowClick", "Zoom LEFT", e)
+                    self.logger.debug("onWindowClick", "Zoom LEFT", e)
                     self.zoom(None, ZoomNavigationDirections.LEFT)
                 elif e.y < self.height / 3:
                     # slideshow controls
                     if e.widget and e.widget._name == "labelFeels":
-                        self.logger.info("onWindowClick", "Next, click on labelFeels", e)
+                        self.logger.debug("onWindowClick", "Next, click on labelFeels", e)
                         self.__change_image(NEXT_IMAGE)
                     elif e.x >= 0 and e.x < self.width / 3:
-                        self.logger.info("onWindowClick", "Previous", e)
+                        self.logger.debug("onWindowClick", "Previous", e)
                         self.__change_image(PREVIOUS_IMAGE)
                     elif e.x >= self.width / 3 and e.x < self.width / 3 * 2:
                         self.is_paused = not self.is_paused
                         if self.is_paused:
-                            self.zoom_helper.init(self.get_image_array())
-                            self.logger.info("onWindowClick", "Pause", e)
+                            self.zoom_helper.init(self.get_image_array(), self.image_name)
+                            self.logger.debug("onWindowClick", "Pause", e)
                             self.label_pause.place(anchor="sw", rely=1)
                         else:
                             self.zoom_helper.reset()
-                            self.logger.info("onWindowClick", "Resume", e)
+                            self.logger.debug("onWindowClick", "Resume", e)
                             self.label_pause.place_forget()
                     elif e.x >= self.width / 3 * 2 and e.x < self.width:
-                        self.logger.info("onWindowClick", "Next", e)
+                        self.logger.debug("onWindowClick", "Next", e)
                         self.__change_image(NEXT_IMAGE)
                 else:
                     # Zoom controls
                     if e.x >= 0 and e.x < self.width / 3:
                         if e.y > self.height / 3 * 2:
-                            self.logger.info("onWindowClick", "Zoom LEFT", e)
+                            self.logger.debug("onWindowClick", "Zoom LEFT", e)
                             self.zoom(None, ZoomNavigationDirections.LEFT)
                         else:
-                            self.logger.info("onWindowClick", "Dezoom", e)
+                            self.logger.debug("onWindowClick", "Dezoom", e)
                             self.zoom(ZoomAction.DEZOOM, None)
                     elif e.x >= self.width / 3 and e.x < self.width / 3 * 2:
                         if e.y > self.height / 3 * 2:
-                            self.logger.info("onWindowClick", "Zoom BOTTOM", e)
+                            self.logger.debug("onWindowClick", "Zoom BOTTOM", e)
                             self.zoom(None, ZoomNavigationDirections.BOTTOM)
                         else:
-                            self.logger.info("onWindowClick", "Zoom UP", e)
+                            self.logger.debug("onWindowClick", "Zoom UP", e)
                             self.zoom(None, ZoomNavigationDirections.UP)
                     elif e.x >= self.width / 3 * 2 and e.x < self.width:
                         if e.y > self.height / 3 * 2:
-                            self.logger.info("onWindowClick", "Zoom RIGHT", e)
+                            self.logger.debug("onWindowClick", "Zoom RIGHT", e)
                             self.zoom(None, ZoomNavigationDirections.RIGHT)
                         else:
-                            self.logger.info("onWindowClick", "Zoom", e)
+                            self.logger.debug("onWindowClick", "Zoom", e)
                             self.zoom(ZoomAction.ZOOM, None)
             else:
                 if e.widget and e.widget._name == "labelFeels":
-                    self.logger.info("onWindowClick", "Next, click on labelFeels", e)
+                    self.logger.debug("onWindowClick", "Next, click on labelFeels", e)
                     self.__change_image(NEXT_IMAGE)
                 elif e.x >= 0 and e.x < self.width / 3:
-                    self.logger.info("onWindowClick", "Previous", e)
+                    self.logger.debug("onWindowClick", "Previous", e)
                     self.__change_image(PREVIOUS_IMAGE)
                 elif e.x >= self.width / 3 and e.x < self.width / 3 * 2:
                     self.is_paused = not self.is_paused
                     if self.is_paused:
-                        self.zoom_helper.init(self.get_image_array())
-                        self.logger.info("onWindowClick", "Pause", e)
+                        self.zoom_helper.init(self.get_image_array(), self.image_name)
+                        self.logger.debug("onWindowClick", "Pause", e)
                         self.label_pause.place(anchor="sw", rely=1)
                     else:
                         self.zoom_helper.reset()
-                        self.logger.info("onWindowClick", "Resume", e)
+                        self.logger.debug("onWindowClick", "Resume", e)
                         self.label_pause.place_forget()
                 elif e.x >= self.width / 3 * 2 and e.x < self.width:
-                    self.logger.info("onWindowClick", "Next", e)
+                    self.logger.debug("onWindowClick", "Next", e)
                     self.__change_image(NEXT_IMAGE)
 
 
-app = SlideShow()
-app.start_slideshow()
+if __name__ == "__main__":
+    app = SlideShow()
+    app.start_slideshow()
@@ -0,0 +1,197 @@
+"""
+    Slide change hot paths: decode, resize, PhotoImage, video, zoom and weather parsing
+
+    Runs headless on synthetic photos (phone resolutions, EXIF orientations) and MP4s.
+    Each case runs in its own process, results (latency percentiles, peak RSS) are saved as JSON.
+    showPIL needs a display, it is skipped without one (run with xvfb-run to measure it).
+
+    > python benchmarks/bench_hot_paths.py [--screen 1920x1080] [--runs 5] [--output results.json]
+                                          [--compare previous.json] [--cases showPIL,get_video_infos]
+"""
+import argparse
+import tempfile
+from os import path
+
+import common  # adds project root to sys.path
+import src.helper as hlpr
+from base_tk import RENDITION_CACHE_MAX_BYTES, VERSION, SlideShow
+from src.logger import Logger
+from src.media_catalog import MediaCatalog
+from src.rendition_cache import RenditionCache
+
+VIDEO_MAX_FPS = 30
+
+
+def create_slideshow(project_path, width, height):
+    """
+        SlideShow without main window nor workers, only what decode paths use
+    """
+    slideshow = SlideShow.__new__(SlideShow)
+    slideshow.PROJECT_PATH = project_path
+    slideshow.logger = Logger(SlideShow.__name__)
+    slideshow.width, slideshow.height = width, height
+    hlpr.create_attachments_path(project_path)
+    slideshow.catalog = MediaCatalog(project_path)
+    slideshow.rendition_cache = RenditionCache(project_path, width, height, RENDITION_CACHE_MAX_BYTES)
+    slideshow.is_paused = True
+    slideshow.image_name = None
+    return slideshow
+
+
+def bench_show_pil(corpus, width, height, runs):
+    import tkinter
+    from tkinter import Label
+    try:
+        window = tkinter.Tk()
+    except tkinter.TclError as e:
+        raise common.BenchmarkSkipped(f"no display ({e})")
+    window.withdraw()
+    from src.frame_presenter import FramePresenter
+    slideshow = create_slideshow(corpus["project_path"], width, height)
+    slideshow.label_image = Label(window)
+    slideshow.presenter = FramePresenter(slideshow.label_image, width, height)
+    images = [hlpr.open_image_oriented(f, width, height).copy() for f in corpus["photos"]]
+    durations = [common.time_ms(slideshow.showPIL, image) for _ in range(runs) for image in images]
+    window.destroy()
+    return durations
+
+
+def bench_get_image(corpus, width, height, runs):
+    slideshow = create_slideshow(corpus["project_path"], width, height)
+    get_image = slideshow._SlideShow__get_image
+
+    def decode(file_path):
+        get_image(file_path).load()
+
+    return [common.time_ms(decode, f) for _ in range(runs) for f in corpus["photos"]]
+
+
+def bench_get_image_array(corpus, width, height, runs):
+    slideshow = create_slideshow(corpus["project_path"], width, height)
+
+    def get_image_array(file_path):
+        slideshow.image_name = file_path
+        slideshow.get_image_array()
+
+    durations = []
+    for run in range(runs + 1):
+        for f in corpus["photos"]:
+            duration = common.time_ms(get_image_array, f)
+            # first run creates renditions
+            if run > 0:
+                durations.append(duration)
+    return durations
+
+
+def bench_get_video_infos(corpus, width, height, runs):
+    if not corpus["videos"]:
+        raise common.BenchmarkSkipped("no video, OpenCV couldn't write mp4v")
+    return [common.time_ms(hlpr.get_video_infos, f, VIDEO_MAX_FPS) for _ in range(runs) for f in corpus["videos"]]
+
+
+def get_zoom_actions():
+    """
+        Zoom in to the last level, pans in each direction, zooms out
+    """
+    from src.zoom import ZoomAction, ZoomLevels, ZoomNavigationDirections
+    nb_levels = len(ZoomLevels.get_zoom_levels())
+    actions = [(ZoomAction.ZOOM, None)] * nb_levels
+    for direction in ZoomNavigationDirections:
+        actions += [(None, direction)] * 3
+    actions += [(ZoomAction.DEZOOM, None)] * nb_levels
+    return actions
+
+
+def bench_zoom(corpus, width, height, runs, render):
+    """
+        render: views rendered from the image pyramid, built before timing like once the
+        background build is done
+    """
+    import numpy as np
+    from src.zoom import Zoom
+    from src.zoom_pyramid import build_pyramid
+    zoom = Zoom()
+    durations = []
+    for f in corpus["photos"]:
+        img_array = np.asarray(hlpr.load_image_to_fit(f, width, height))
+        zoom.init(img_array)
+        if render:
+            original = np.asarray(hlpr.open_image_oriented(f).convert("RGB"))
+            zoom.renderer.set_levels(build_pyramid(original, img_array.shape[1], img_array.shape[0], img_array))
+        zoom_func = zoom.render_zoom if render else zoom.set_zoom
+        for _ in range(runs):
+            for action, direction in get_zoom_actions():
+                durations.append(common.time_ms(zoom_func, action, direction))
+    return durations
+
+
+def bench_set_zoom(corpus, width, height, runs):
+    return bench_zoom(corpus, width, height, runs, False)
+
+
+def bench_render_zoom(corpus, width, height, runs):
+    return bench_zoom(corpus, width, height, runs, True)
+
+
+def bench_weather_parser(corpus, width, height, runs):
+    from bench_weather_parser import load_fixtures, parse_with_extractor
+    pages = list(load_fixtures().values())
+    return [common.time_ms(parse_with_extractor, html) for _ in range(runs) for html in pages]
+
+
+CASES = {
+    "showPIL": bench_show_pil,
+    "__get_image": bench_get_image,
+    "get_image_array": bench_get_image_array,
+    "get_video_infos": bench_get_video_infos,
+    "Zoom.set_zoom": bench_set_zoom,
+    "Zoom.render_zoom": bench_render_zoom,
+    "weather_parser": bench_weather_parser,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--screen", default="1920x1080")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--video-seconds", type=float, default=2)
+    parser.add_argument("--cases", help="comma separated cases, all if not set: " + ",".join(CASES))
+    parser.add_argument("--output", help="JSON results file, in benchmarks/results if not set")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    args = parser.parse_args()
+    width, height = [int(v) for v in args.screen.split("x")]
+    names = args.cases.split(",") if args.cases else list(CASES)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = {"project_path": tmp, "photos": common.generate_photos(tmp)}
+        try:
+            corpus["videos"] = common.generate_videos(tmp, args.video_seconds)
+        except Exception as e:
+            print("no video generated:", e)
+            corpus["videos"] = []
+        baseline_kb = common.get_baseline_rss_kb()
+        print(f"screen {width}x{height}, {len(corpus['photos'])} photo(s), {len(corpus['videos'])} video(s), "
+              f"{args.runs} run(s)")
+        cases = {}
+        for name in names:
+            durations, peak_kb, error = common.run_in_process(CASES[name], corpus, width, height, args.runs)
+            if error:
+                cases[name] = {"error": error}
+                print(f"  {name:<20} {error}")
+                continue
+            result = common.get_percentiles(durations)
+            result["peak_rss_mb"] = round((peak_kb - baseline_kb) / 1024, 1)
+            cases[name] = result
+            print(f"  {name:<20} p50 {result['p50_ms']:9.2f} ms   p90 {result['p90_ms']:9.2f} ms   "
+                  f"p99 {result['p99_ms']:9.2f} ms   peak memory +{result['peak_rss_mb']:7.1f} MB")
+
+    output = args.output or path.join(common.RESULTS_PATH, f"hot_paths_{VERSION}_{common.get_git_revision()}.json")
+    common.save_results(output, "hot_paths", cases, version=VERSION, screen=args.screen, runs=args.runs,
+                        baseline_rss_mb=round(baseline_kb / 1024, 1))
+    print("results saved in", output)
+    if args.compare:
+        common.print_comparison(args.compare, cases)
+
+
+if __name__ == "__main__":
+    main()
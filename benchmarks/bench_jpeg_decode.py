@@ -0,0 +1,61 @@
+"""
+    Photo decoding to screen size: full resolution decode vs reduced (DCT scaled) decode
+
+    Decode time and peak memory per photo, each photo and mode runs in its own
+    process so peak RSS isn't shared between measures.
+
+    > python benchmarks/bench_jpeg_decode.py [--screen 1920x1080] [--runs 5] [--photos folder]
+"""
+import argparse
+import statistics
+import tempfile
+from os import listdir, path
+
+import common  # adds project root to sys.path
+import src.helper as hlpr
+
+
+def decode_full(file_path, width, height):
+    return hlpr.resize_to_fit(hlpr.open_image_oriented(file_path), width, height)
+
+
+def decode_reduced(file_path, width, height):
+    return hlpr.load_image_to_fit(file_path, width, height)
+
+
+MODES = {"full": decode_full, "reduced": decode_reduced}
+
+
+def run_mode(mode, files, width, height, runs):
+    durations = {}
+    for file_path in files:
+        durations[file_path] = [common.time_ms(lambda: MODES[mode](file_path, width, height).load())
+                                for _ in range(runs)]
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--screen", default="1920x1080")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--photos", help="folder of JPEG photos, synthetic photos if not set")
+    args = parser.parse_args()
+    width, height = [int(v) for v in args.screen.split("x")]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.photos:
+            files = [path.join(args.photos, f) for f in sorted(listdir(args.photos)) if hlpr.is_valid_image_file(f)]
+        else:
+            files = common.generate_photos(tmp)
+        baseline_kb = common.get_baseline_rss_kb()
+        print(f"screen {width}x{height}")
+        for file_path in files:
+            print(f"  {path.basename(file_path)}")
+            for mode in MODES:
+                durations, peak_kb, _ = common.run_in_process(run_mode, mode, [file_path], width, height, args.runs)
+                print(f"    {mode:<8} median {statistics.median(durations[file_path]):8.1f} ms"
+                      f"   peak memory +{(peak_kb - baseline_kb) / 1024:6.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+    Frame presentation: new PhotoImage per frame (previous path) vs FramePresenter (PhotoImage updated in place)
+
+    Frame time, RSS growth (current and peak, C allocations of Pillow and Tk included) per mode,
+    each mode in its own process.
+    Needs a display (run with xvfb-run on a headless box).
+
+    > python benchmarks/bench_presentation.py [--screen 1920x1080] [--frames 300] [--output results.json]
+"""
+import argparse
+from os import path
+
+import common  # adds project root to sys.path
+import src.helper as hlpr
+
+VIDEO_SIZE = (1280, 720)  # frames letterboxed on screen
+
+
+def create_label(width, height):
+    import tkinter
+    try:
+        window = tkinter.Tk()
+    except tkinter.TclError as e:
+        raise common.BenchmarkSkipped(f"no display ({e})")
+    window.withdraw()
+    label = tkinter.Label(window, width=width, height=height, bg="black")
+    label.pack()
+    return window, label
+
+
+def create_frames(count=8):
+    """
+        Video frames as VideoStream.read returns them, reused in turn
+    """
+    import numpy as np
+    width, height = VIDEO_SIZE
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=2).astype(np.uint8)
+    return [np.roll(base, i * 16, axis=1) for i in range(count)]
+
+
+def present_with_photo_image(label, width, height):
+    from PIL import Image, ImageTk
+
+    def present(img_array):
+        pil_image = hlpr.resize_to_fit(Image.fromarray(img_array), width, height)
+        image = ImageTk.PhotoImage(pil_image)
+        label.image = image
+        label.configure(image=image)
+    return present
+
+
+def present_with_presenter(label, width, height):
+    from src.frame_presenter import FramePresenter
+    return FramePresenter(label, width, height).present_array
+
+
+MODES = {"photo_image": present_with_photo_image, "frame_presenter": present_with_presenter}
+
+
+def run_mode(mode, width, height, nb_frames):
+    window, label = create_label(width, height)
+    frames = create_frames()
+    present = MODES[mode](label, width, height)
+    # warm up: first Tk image and buffers
+    for frame in frames:
+        present(frame)
+        window.update_idletasks()
+    rss_before_kb, peak_rss_before_kb = common.get_rss_kb(), common.get_peak_rss_kb()
+    durations = []
+    for i in range(nb_frames):
+        durations.append(common.time_ms(present, frames[i % len(frames)]))
+        # Tk redraws
+        window.update_idletasks()
+    result = common.get_percentiles(durations)
+    result["rss_growth_mb"] = round((common.get_rss_kb() - rss_before_kb) / 1024, 1)
+    result["peak_rss_growth_mb"] = round((common.get_peak_rss_kb() - peak_rss_before_kb) / 1024, 1)
+    result["tk_images"] = len(window.image_names())
+    window.destroy()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--screen", default="1920x1080")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--output", help="JSON results file, in benchmarks/results if not set")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    args = parser.parse_args()
+    width, height = [int(v) for v in args.screen.split("x")]
+
+    print(f"screen {width}x{height}, frames {VIDEO_SIZE[0]}x{VIDEO_SIZE[1]}, {args.frames} frame(s)")
+    cases = {}
+    for mode in MODES:
+        result, _, error = common.run_in_process(run_mode, mode, width, height, args.frames)
+        if error:
+            cases[mode] = {"error": error}
+            print(f"  {mode:<16} {error}")
+            continue
+        cases[mode] = result
+        print(f"  {mode:<16} p50 {result['p50_ms']:7.2f} ms   p99 {result['p99_ms']:7.2f} ms   "
+              f"rss +{result['rss_growth_mb']:6.1f} MB   peak rss +{result['peak_rss_growth_mb']:6.1f} MB   "
+              f"tk images {result['tk_images']}")
+
+    output = args.output or path.join(common.RESULTS_PATH, f"presentation_{common.get_git_revision()}.json")
+    common.save_results(output, "presentation", cases, screen=args.screen, frames=args.frames)
+    print("results saved in", output)
+    if args.compare:
+        common.print_comparison(args.compare, cases)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+    Cold start: import time of the app and of heavy modules, time to the first slide on screen
+
+    Import times are measured with python -X importtime, each run in a fresh interpreter.
+    Startup runs SlideShow() up to the first slide drawn, with an empty rendition cache (catalog
+    loaded before the first slide), then with the last slide cached (catalog loaded after), and
+    keeps the functions taking most time (cProfile). Startup needs a display, it is skipped
+    without one (run with xvfb-run).
+
+    > python benchmarks/bench_startup.py [--runs 5] [--output results.json] [--compare previous.json]
+"""
+import argparse
+import cProfile
+import pstats
+import subprocess
+import sys
+import tempfile
+import time
+from os import environ, makedirs, path
+
+import common  # adds project root to sys.path
+
+MODULES = ["base_tk", "numpy", "cv2", "PIL.Image", "googleapiclient.discovery", "firebase_admin", "requests"]
+PROFILE_TOP = 15  # functions kept in results, by cumulative time
+
+
+def get_import_time_ms(module):
+    """
+        Returns (cumulative import time in ms, heaviest imports [(module, ms)]) in a fresh interpreter
+    """
+    res = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=common.ROOT_PATH,
+                         capture_output=True, text=True)
+    if res.returncode != 0:
+        raise common.BenchmarkSkipped(res.stderr.strip().splitlines()[-1] if res.stderr else "import failed")
+    imports = {}
+    for line in res.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imports[name.strip()] = int(cumulative) / 1000
+    heaviest = sorted(((name, ms) for name, ms in imports.items() if name != module and "." not in name),
+                      key=lambda x: x[1], reverse=True)[:5]
+    return imports.get(module, 0), heaviest
+
+
+def bench_import(module, runs):
+    durations, heaviest = [], []
+    for _ in range(runs):
+        duration, heaviest = get_import_time_ms(module)
+        durations.append(duration)
+    return durations, heaviest
+
+
+def run_startup(project_path):
+    """
+        Runs in its own process: imports the app, creates SlideShow and shows the first slide
+        Returns (import ms, first slide ms, profile [(function, cumulative ms)], first slide from rendition cache)
+    """
+    environ["PROJECT_PATH"] = project_path
+    import tkinter
+    try:
+        tkinter.Tk().destroy()
+    except tkinter.TclError as e:
+        raise common.BenchmarkSkipped(f"no display ({e})")
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    import base_tk
+    imported = time.perf_counter()
+    app = base_tk.SlideShow()
+    is_first_slide_cached = app.show_startup_slide()
+    profiler.disable()
+    shown = time.perf_counter()
+    if app.image_name is None:
+        raise RuntimeError("no slide shown, photos not added to catalog")
+    # position of the next run
+    app.playlist.save()
+    stats = pstats.Stats(profiler)
+    entries = sorted(stats.stats.items(), key=lambda x: x[1][3], reverse=True)[:PROFILE_TOP]
+    profile = [(f"{path.basename(f)}:{line}({name})", round(cumulative * 1000, 1))
+               for (f, line, name), (_, _, _, cumulative, _) in entries]
+    app.main_window.unbind("<Destroy>")
+    app.prefetcher.shutdown()
+    app.main_window.destroy()
+    return (imported - start) * 1000, (shown - imported) * 1000, profile, is_first_slide_cached
+
+
+def print_case(name, result):
+    print(f"  {name:<34} p50 {result['p50_ms']:9.2f} ms   max {result['max_ms']:9.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="JSON results file, in benchmarks/results if not set")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    args = parser.parse_args()
+
+    cases = {}
+    print(f"import time, {args.runs} run(s)")
+    for module in MODULES:
+        name = "import " + module
+        try:
+            durations, heaviest = bench_import(module, args.runs)
+        except common.BenchmarkSkipped as e:
+            cases[name] = {"error": f"skipped: {e}"}
+            print(f"  {name:<34} skipped: {e}")
+            continue
+        cases[name] = common.get_percentiles(durations)
+        cases[name]["heaviest_imports_ms"] = heaviest
+        print_case(name, cases[name])
+
+    print("startup, first slide")
+    with tempfile.TemporaryDirectory() as tmp:
+        # photos in attachments folder, added to catalog at first start
+        attachments = path.join(tmp, "attachments")
+        makedirs(attachments)
+        common.generate_photos(attachments)
+        for cache in ("cold_cache", "warm_cache"):
+            imports, first_slides, profile, error = [], [], None, None
+            for _ in range(args.runs):
+                value, _, error = common.run_in_process(run_startup, tmp)
+                if not error and value[3] != (cache == "warm_cache"):
+                    error = "error: first slide " + ("not " if value[3] else "") + "expected from rendition cache"
+                if error:
+                    break
+                imports.append(value[0])
+                first_slides.append(value[1])
+                profile = value[2]
+                if cache == "cold_cache":
+                    # renditions created by the run
+                    break
+            if error:
+                cases["startup_" + cache] = {"error": error}
+                print(f"  {'startup_' + cache:<34} {error}")
+                continue
+            for name, durations in [("startup_import_" + cache, imports),
+                                    ("startup_first_slide_" + cache, first_slides)]:
+                cases[name] = common.get_percentiles(durations)
+                print_case(name, cases[name])
+            cases["startup_first_slide_" + cache]["profile_ms"] = profile
+
+    output = args.output or path.join(common.RESULTS_PATH, f"startup_{common.get_git_revision()}.json")
+    common.save_results(output, "startup", cases, runs=args.runs)
+    print("results saved in", output)
+    if args.compare:
+        common.print_comparison(args.compare, cases)
+
+
+if __name__ == "__main__":
+    main()
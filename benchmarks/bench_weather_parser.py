@@ -0,0 +1,82 @@
+"""
+    Weather page parsing: BeautifulSoup (previous parser) vs extract_spans_text
+    on synthetic pages of fixtures/, padded to page size (pip install -r benchmarks/requirements.txt)
+
+    > python benchmarks/bench_weather_parser.py [--runs 20]
+"""
+import argparse
+import re
+from os import listdir, path
+
+import common  # adds project root to sys.path
+from src.weather_com import WeatherDotCom, extract_spans_text
+
+FIXTURES_PATH = common.FIXTURES_PATH
+PREFIXES = [WeatherDotCom.TEMP_CLASS_PREFIX, WeatherDotCom.FEELS_LIKE_CLASS_PREFIX]
+PADDING_PATTERN = re.compile(r"<!-- padding:(\w+):(\d+) -->")
+# filler markup, {i} is the index of the element
+FILLERS = {
+    "links": '<link rel="preload" href="/daybreak-today/assets/chunk-{i:04d}.{i:08x}.js" as="script"/>',
+    "script": '<script>window.__data{i}={{"id": {i}, "v": 0.{i:06d}, "s": "xxxxxxxxxxxxxxxxxxxxxxxx"}};</script>',
+    "cards": '<div class="Card--content--{i:05x}"><a href="/weather/tenday/l/{i:016x}" class="Button--default--{i:04x}">'
+             '<span class="Ellipsis--ellipsis--{i:04x}">Item {i}</span></a><svg class="Icon--icon--{i:04x}" '
+             'viewBox="0 0 24 24"><path d="M12 2l3 7h7l-5.5 4 2 7-6.5-4.5L5.5 20l2-7L2 9h7z"></path></svg></div>',
+}
+
+
+def pad(match):
+    """
+        Returns filler markup of the kind and size in KB of the padding comment
+    """
+    kind, size = match.group(1), int(match.group(2)) * 1024
+    elements, length, i = [], 0, 0
+    while length < size:
+        elements.append(FILLERS[kind].format(i=i))
+        length += len(elements[-1])
+        i += 1
+    return "".join(elements)
+
+
+def load_fixtures():
+    """
+        Returns {fixture name: page}, fixtures padded to the size of a real page
+    """
+    pages = {}
+    for fixture in sorted(f for f in listdir(FIXTURES_PATH) if f.startswith("weather_") and f.endswith(".html")):
+        with open(path.join(FIXTURES_PATH, fixture), "r", encoding="UTF-8") as f:
+            pages[fixture] = PADDING_PATTERN.sub(pad, f.read())
+    return pages
+
+
+def parse_with_bs4(html):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    values = {}
+    for prefix in PREFIXES:
+        res = soup.find("span", class_=lambda c: c and c.startswith(prefix))
+        if res:
+            values[prefix] = res.text
+    return values
+
+
+def parse_with_extractor(html):
+    return extract_spans_text(html, PREFIXES)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    for fixture, html in load_fixtures().items():
+        expected = parse_with_bs4(html)
+        if parse_with_extractor(html) != expected:
+            raise AssertionError(f"{fixture}: extractor result differs from BeautifulSoup {expected}")
+        print(f"{fixture} ({len(html) / 1024:.0f} KB) {expected}")
+        for name, func in [("bs4 html.parser", parse_with_bs4), ("extract_spans_text", parse_with_extractor)]:
+            result = common.get_percentiles([common.time_ms(func, html) for _ in range(args.runs)])
+            print(f"  {name:<20} median {result['p50_ms']:8.2f} ms   max {result['max_ms']:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
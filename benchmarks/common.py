@@ -0,0 +1,192 @@
+"""
+    Shared code of the benchmarks: synthetic corpus, timing, percentiles, peak memory, JSON results
+"""
+import json
+import multiprocessing
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime as dt
+from os import makedirs, path
+
+ROOT_PATH = path.dirname(path.dirname(path.abspath(__file__)))
+FIXTURES_PATH = path.join(path.dirname(path.abspath(__file__)), "fixtures")
+RESULTS_PATH = path.join(path.dirname(path.abspath(__file__)), "results")
+
+if ROOT_PATH not in sys.path:
+    sys.path.insert(0, ROOT_PATH)
+
+PHONE_RESOLUTIONS = [(4032, 3024), (4000, 3000), (3264, 2448)]  # 12MP, 12MP, 8MP
+ORIENTATIONS = [1, 6, 3, 8]
+PHOTOS_EPOCH_MS = 1704067200000  # date of synthetic photos, in their filename like downloaded attachments
+VIDEO_FORMATS = [(1920, 1080, 30), (1280, 720, 60)]  # width, height, fps
+
+
+class BenchmarkSkipped(Exception):
+    """
+        Raised by a benchmark that can't run in this environment
+    """
+
+
+def generate_photos(folder, resolutions=PHONE_RESOLUTIONS, orientations=ORIENTATIONS):
+    """
+        Synthetic JPEG photos at common phone resolutions, with EXIF orientations
+        Named <id>_<epoch_ms>_<n> like downloaded attachments, so the catalog adds them
+    """
+    import numpy as np
+    from PIL import Image
+    rng = np.random.default_rng(0)
+    files = []
+    for i, (width, height) in enumerate(resolutions):
+        orientation = orientations[i % len(orientations)]
+        x = np.linspace(0, 255, width, dtype=np.float32)
+        y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+        array = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=2)
+        array += rng.normal(0, 12, (height, width, 1)).astype(np.float32)
+        image = Image.fromarray(np.clip(array, 0, 255).astype(np.uint8))
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        file_path = path.join(folder, f"photo{width}x{height}o{orientation}_{PHOTOS_EPOCH_MS + i * 60000}_{i}.jpg")
+        image.save(file_path, "JPEG", quality=90, exif=exif.tobytes())
+        files.append(file_path)
+    return files
+
+
+def generate_videos(folder, seconds=2, formats=VIDEO_FORMATS):
+    """
+        Synthetic MP4 videos (mp4v), a gradient scrolling horizontally
+    """
+    import cv2
+    import numpy as np
+    files = []
+    for width, height, fps in formats:
+        file_path = path.join(folder, f"video_{width}x{height}_{fps}fps.mp4")
+        writer = cv2.VideoWriter(file_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+        x = np.linspace(0, 255, width, dtype=np.float32)
+        y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+        base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=2).astype(np.uint8)
+        for i in range(int(seconds * fps)):
+            writer.write(np.roll(base, i * 8, axis=1))
+        writer.release()
+        files.append(file_path)
+    return files
+
+
+def get_peak_rss_kb():
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def get_rss_kb():
+    """
+        Current RSS, C allocations included (Pillow, numpy, Tk), peak RSS if /proc isn't available
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() // 1024
+    except OSError:
+        return get_peak_rss_kb()
+
+
+def time_ms(func, *args):
+    """
+        Returns duration of func(*args) in ms
+    """
+    start = time.perf_counter()
+    func(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def get_percentiles(durations):
+    """
+        Returns p50, p90, p99, max and mean of durations (ms)
+    """
+    if len(durations) > 1:
+        q = statistics.quantiles(durations, n=100, method="inclusive")
+        p50, p90, p99 = q[49], q[89], q[98]
+    else:
+        p50 = p90 = p99 = durations[0]
+    return {"p50_ms": round(p50, 3), "p90_ms": round(p90, 3), "p99_ms": round(p99, 3),
+            "max_ms": round(max(durations), 3), "mean_ms": round(statistics.fmean(durations), 3),
+            "calls": len(durations)}
+
+
+def _run_and_measure(target, args, results):
+    try:
+        value, error = target(*args), None
+    except BenchmarkSkipped as e:
+        value, error = None, f"skipped: {e}"
+    except Exception as e:
+        value, error = None, f"error: {e!r}"
+    results.put((value, get_peak_rss_kb(), error))
+
+
+def _noop():
+    return None
+
+
+def run_in_process(target, *args):
+    """
+        Runs target(*args) in its own process, so peak RSS isn't shared between measures
+        Returns (value, peak_rss_kb, error)
+    """
+    results = multiprocessing.Queue()
+    p = multiprocessing.Process(target=_run_and_measure, args=(target, args, results))
+    p.start()
+    result = results.get()
+    p.join()
+    return result
+
+
+def get_baseline_rss_kb():
+    """
+        Peak RSS of a process that runs nothing, modules already imported by the caller
+    """
+    return run_in_process(_noop)[1]
+
+
+def get_git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_PATH, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def save_results(file_path, name, cases, **infos):
+    """
+        Saves results as JSON, to be compared with results of another version
+    """
+    report = {
+        "benchmark": name,
+        "date": dt.now().isoformat(timespec="seconds"),
+        "git_revision": get_git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        **infos,
+        "cases": cases,
+    }
+    folder = path.dirname(path.abspath(file_path))
+    makedirs(folder, exist_ok=True)
+    with open(file_path, "w", encoding="UTF-8") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def print_comparison(previous_path, cases, key="p50_ms"):
+    """
+        Prints change of key between previous results and cases
+    """
+    with open(previous_path, "r", encoding="UTF-8") as f:
+        previous = json.load(f)
+    print(f"compared with {previous.get('git_revision')} ({previous.get('date')}), {key}")
+    for name, result in cases.items():
+        before = previous["cases"].get(name, {}).get(key)
+        after = result.get(key)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before * 100 if before else 0
+        print(f"  {name:<24} {before:10.2f} -> {after:10.2f}   {change:+6.1f}%")
@@ -0,0 +1,89 @@
+import base64
+from os import remove, replace
+
+
+def iter_json_string_field(chunks, field: str):
+    """
+        :param chunks: JSON document as an iterable of bytes
+        :param field: name of a string field without escaped characters (base64 data)
+
+        Yields value of the field piece by piece, without loading the whole document
+    """
+    marker = f'"{field}"'.encode("UTF-8")
+    header = b""
+    in_value = False
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if not in_value:
+            header += chunk
+            i = header.find(marker)
+            if i < 0:
+                # keeps the end, marker may be cut between chunks
+                header = header[-len(marker):]
+                continue
+            j = header.find(b'"', i + len(marker))
+            if j < 0:
+                continue
+            in_value = True
+            chunk = header[j + 1:]
+            header = b""
+        end = chunk.find(b'"')
+        if end >= 0:
+            yield chunk[:end].decode("ascii")
+            return
+        yield chunk.decode("ascii")
+    raise ValueError(f"field[{field}] not found or not terminated")
+
+
+class Base64FileWriter:
+    """
+        Decodes base64url text by chunks into a temporary file,
+        renamed to filepath when complete
+
+        Memory used is bounded by chunk_size, whatever the file size
+    """
+
+    def __init__(self, filepath: str, chunk_size: int) -> None:
+        self.filepath = filepath
+        # multiple of 4 characters, so each chunk decodes alone
+        self.chunk_size = max(4, chunk_size - chunk_size % 4)
+        self.size = 0
+        self._tmp_path = filepath + ".part"
+        self._file = open(self._tmp_path, "wb")
+        self._pending = ""
+
+    def __write_decoded(self, text: str):
+        data = base64.urlsafe_b64decode(text)
+        self._file.write(data)
+        self.size += len(data)
+
+    def write(self, text: str):
+        self._pending += text
+        while len(self._pending) >= self.chunk_size:
+            self.__write_decoded(self._pending[:self.chunk_size])
+            self._pending = self._pending[self.chunk_size:]
+
+    def commit(self):
+        if self._pending:
+            self.__write_decoded(self._pending + "=" * (-len(self._pending) % 4))
+            self._pending = ""
+        self._file.close()
+        replace(self._tmp_path, self.filepath)
+
+    def abort(self):
+        self._file.close()
+        try:
+            remove(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
@@ -0,0 +1,116 @@
+from os import path, remove
+import numpy as np
+from PIL import Image
+from src.logger import Logger
+from src.media_catalog import HASH_BANDS, MediaCatalog, MediaStatus
+from src.media_metadata import MEDIA_TYPE_IMAGE, MEDIA_TYPE_VIDEO
+from src.metrics import metrics
+import src.helper as hlpr
+
+HASH_SIZE = 8  # 8x8 gradients, 64 bits hash
+NB_BANDS = HASH_BANDS  # hash split in 16 bits bands, exact match on one band if distance < NB_BANDS
+VIDEO_KEYFRAME_MS = 1000  # frame hashed, first frames are often black
+
+
+def dhash(gray):
+    """
+        :param gray: grayscale array of (HASH_SIZE, HASH_SIZE + 1)
+        Returns 64 bits difference hash: each bit tells if a pixel is brighter than its left neighbour
+    """
+    bits = gray[:, 1:] > gray[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def get_image_hash(file_path):
+    # JPEG decoded at 1/8 scale
+    pil_image = hlpr.open_image_oriented(file_path, HASH_SIZE * 8, HASH_SIZE * 8).convert("L")
+    return dhash(np.asarray(pil_image.resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR), dtype=np.int16))
+
+
+def get_video_hash(file_path):
+    import cv2
+    cap = cv2.VideoCapture(file_path)
+    try:
+        cap.set(cv2.CAP_PROP_POS_MSEC, VIDEO_KEYFRAME_MS)
+        ret, frame = cap.read()
+        if not ret:
+            # shorter than VIDEO_KEYFRAME_MS
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = cap.read()
+        if not ret:
+            return None
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return dhash(cv2.resize(gray, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA).astype(np.int16))
+    finally:
+        cap.release()
+
+
+def get_bands(h: int):
+    """
+        Returns NB_BANDS parts of hash h, low bits first
+    """
+    band_bits = HASH_SIZE * HASH_SIZE // NB_BANDS
+    mask = (1 << band_bits) - 1
+    return [(h >> (i * band_bits)) & mask for i in range(NB_BANDS)]
+
+
+def hamming_distance(h1: int, h2: int) -> int:
+    return bin(h1 ^ h2).count("1")
+
+
+class Deduplicator:
+    """
+        Hides photos and videos received twice (mail and firebase)
+
+        Files are hashed oldest first, a file whose hash is within max_distance
+        of an already hashed file of the same type gets DUPLICATE status: out of
+        playlist, and removed from disk if delete_files. Hashes are indexed by
+        bands in catalog, a hash within NB_BANDS - 1 bits shares at least one band.
+    """
+
+    def __init__(self, catalog: MediaCatalog, max_distance: int = NB_BANDS - 1, delete_files: bool = False) -> None:
+        self.logger = Logger(self.__class__.__name__)
+        self.catalog = catalog
+        self.max_distance = min(max_distance, NB_BANDS - 1)
+        self.delete_files = delete_files
+
+    def __get_hash(self, file_path):
+        """
+            Returns (media type, hash), hash is None if file can't be read
+        """
+        try:
+            if hlpr.is_valid_video_file(file_path):
+                return MEDIA_TYPE_VIDEO, get_video_hash(file_path)
+            return MEDIA_TYPE_IMAGE, get_image_hash(file_path)
+        except Exception as e:
+            self.logger.warning("__get_hash", f"can't hash[{path.basename(file_path)}]", e)
+        return MEDIA_TYPE_IMAGE, None
+
+    def __find_original(self, media_type, h):
+        for filename, other in self.catalog.get_hash_candidates(media_type, get_bands(h)):
+            if hamming_distance(h, other) <= self.max_distance:
+                return filename
+        return None
+
+    def run(self, files) -> int:
+        """
+            Hashes files (not hashed yet, oldest first), returns number of duplicates found
+        """
+        duplicates = 0
+        for file_path in files:
+            media_type, h = self.__get_hash(file_path)
+            # uniform images (0) would all match
+            original = self.__find_original(media_type, h) if h else None
+            self.catalog.set_hash(file_path, media_type, h, get_bands(h) if h else None)
+            if original is None:
+                continue
+            duplicates += 1
+            self.logger.info("run", f"[{path.basename(file_path)}] duplicate of [{original}]")
+            self.catalog.set_status(file_path, MediaStatus.DUPLICATE)
+            if self.delete_files:
+                try:
+                    remove(file_path)
+                except Exception as e:
+                    self.logger.error("run", f"can't remove[{path.basename(file_path)}]", e)
+        metrics.increment("dedup_duplicates", duplicates)
+        return duplicates
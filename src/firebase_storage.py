@@ -1,8 +1,12 @@
 import firebase_admin
 from firebase_admin import storage
-from os import path, listdir, getenv
+from os import path, getenv, remove, replace
+from concurrent.futures import ThreadPoolExecutor
+import time
 from google.api_core import retry
 from src.logger import Logger
+from src.metrics import metrics
+from src.media_catalog import MediaCatalog, MediaSource
 import src.helper as hlpr
 import dotenv
 
@@ -10,7 +14,9 @@ dotenv.load_dotenv()
 
 
 class FirebaseStorage:
-    def __init__(self, outpath: str) -> None:
+    PAGE_SIZE = 500
+
+    def __init__(self, outpath: str, catalog: MediaCatalog = None, download_workers: int = 4) -> None:
         if not outpath:
             raise Exception(f"outpath invalid [{outpath}]")
         if outpath.find("attachments") > 0:
@@ -19,6 +25,8 @@ class FirebaseStorage:
             self.project_path = outpath
         self.logger = Logger(self.__class__.__name__)
         hlpr.create_attachments_path(self.project_path)
+        self.catalog = catalog if catalog else MediaCatalog(self.project_path)
+        self.download_workers = max(1, download_workers)
         self._STORAGE_BUCKET = getenv("FIREBASE_STORAGE_BUCKET")
         self.bucket = self.__get_bucket()
 
@@ -39,9 +47,11 @@ class FirebaseStorage:
         return str(epoch_generation) + "_" + epoch_ms + "_" + filename + extension
 
     def __get_bucket(self):
-        firebase_admin.initialize_app(options={
-            'storageBucket': self._STORAGE_BUCKET
-        })
+        if not firebase_admin._apps:
+            # already initialized if a previous FirebaseStorage failed after it
+            firebase_admin.initialize_app(options={
+                'storageBucket': self._STORAGE_BUCKET
+            })
 
         return storage.bucket()
 
@@ -57,51 +67,76 @@ class FirebaseStorage:
         #     if id:
         #         blob.download_to_filename(id, start=0, end=blob.size)
 
-    def __get_all_blobs_uploaded(self):
+    def __iter_blobs_uploaded(self):
+        """
+            Yields blobs in 'cadre_photos/', page by page
+        """
+        blobs = self.bucket.list_blobs(prefix="cadre_photos/", timeout=10, page_size=self.PAGE_SIZE,
+                                       fields="items(name,generation,size),nextPageToken",
+                                       retry=retry.Retry(initial=2, maximum=4, deadline=10))
+        for page in blobs.pages:
+            for blob in page:
+                yield blob
+
+    def __download_blob(self, blob, filename):
+        """
+            Returns path of the file downloaded, None if failed
+            Downloaded to a temporary file renamed when complete, an interrupted download leaves no truncated file
+        """
+        filepath = path.join(hlpr.get_path_attachments(self.project_path), filename)
+        tmp_path = filepath + ".part"
         try:
-            blobs = self.bucket.list_blobs(prefix="cadre_photos/", timeout=10,
-                                           retry=retry.Retry(initial=2, maximum=4, deadline=10))
-            listBlobs = list(blobs)
-            self.logger.info("__get_all_blobs_uploaded", f"{len(listBlobs)} blobs found in 'cadre_photos/'")
-            return listBlobs
+            blob.download_to_filename(tmp_path, start=0, end=blob.size)
+            replace(tmp_path, filepath)
+            _, epoch_ms = hlpr.parse_media_filename(filename)
+            self.catalog.add(filename, MediaSource.FIREBASE, str(blob.generation), epoch_ms)
+            self.logger.info("__download_blob", f"filename[{filename}] downloaded")
+            return filepath
         except Exception as e:
-            self.logger.error("__get_all_blobs_uploaded", "Exception", e)
-        return []
-
-    def __is_file_already_downloaded(self, msg_id, files_downloaded):
-        for f in files_downloaded:
-            if f.startswith(msg_id):
-                return True
-        return False
+            self.logger.error("__download_blob", f"Exception downloading[{blob.name}]", e)
+            try:
+                remove(tmp_path)
+            except FileNotFoundError:
+                pass
+        return None
 
     def download_new_medias(self):
         """
             Download new video/image uploaded
         """
         if self.bucket:
-            listBlobs = self.__get_all_blobs_uploaded()
-            if listBlobs and len(listBlobs) > 0:
-                path_files_downloaded = []
-                try:
-                    files_downloaded = listdir(hlpr.get_path_attachments(self.project_path))
+            path_files_downloaded = []
+            nb_blobs, nb_bytes = 0, 0
+            start = time.monotonic()
+            futures = {}
+            try:
+                with ThreadPoolExecutor(max_workers=self.download_workers, thread_name_prefix="firebase") as executor:
                     # blob C:\Python38\Lib\site-packages\google\cloud\storage\blob.py
-                    for blob in listBlobs:
-                        # print("----- " + blob.id + " -----")
-                        # print("-- name: " + blob.name)
-                        ext = hlpr.get_file_extension_if_valid(blob.name)
-                        if not ext:
-                            self.logger.info("download_new_medias", f"Bad file extension[{blob.name}]")
-                            continue
+                    for blob in self.__iter_blobs_uploaded():
+                        nb_blobs += 1
                         id = str(blob.generation)
-                        if not self.__is_file_already_downloaded(id, files_downloaded):
-                            filename = self.__generate_filename(id, blob.name)
-                            if filename:
-                                filepath = path.join(hlpr.get_path_attachments(self.project_path), filename)
-                                blob.download_to_filename(filepath, start=0, end=blob.size)
-                                path_files_downloaded.append(filepath)
-                                self.logger.info("download_new_medias", f"filename[{filename}] downloaded")
-                except Exception as e:
-                    self.logger.error("download_new_medias", "Exception", e)
-                return path_files_downloaded
+                        if not hlpr.get_file_extension_if_valid(blob.name):
+                            self.logger.debug("download_new_medias", f"Bad file extension[{blob.name}]")
+                            continue
+                        if self.catalog.has_remote_id(MediaSource.FIREBASE, id):
+                            continue
+                        filename = self.__generate_filename(id, blob.name)
+                        if filename:
+                            futures[executor.submit(self.__download_blob, blob, filename)] = blob
+            except Exception as e:
+                self.logger.error("download_new_medias", "Exception", e)
+
+            for future, blob in futures.items():
+                filepath = future.result()
+                if filepath:
+                    path_files_downloaded.append(filepath)
+                    nb_bytes += blob.size or 0
+
+            elapsed = time.monotonic() - start
+            metrics.increment("sync_firebase_files", len(path_files_downloaded))
+            metrics.increment("sync_firebase_bytes", nb_bytes)
+            self.logger.info("download_new_medias",
+                             f"{nb_blobs} blob(s) listed, {len(path_files_downloaded)} downloaded, {nb_bytes} bytes "
+                             f"in {elapsed:.1f}s ({nb_bytes / 1024 / max(elapsed, 0.001):.0f} KB/s)")
+            return path_files_downloaded
         return None
-    
@@ -0,0 +1,72 @@
+import numpy as np
+from PIL import Image, ImageTk
+
+
+def _new_block_image(mode: str, size):
+    """
+        Returns image stored in one memory block, PhotoImage.paste blits it without converting it
+        (images of Image.new are stored by lines and are converted to a new block on each paste)
+    """
+    new_block = getattr(Image.core, "new_block", None)
+    if new_block is None:
+        return Image.new(mode, size)
+    return Image.new(mode, (1, 1))._new(new_block(mode, size))
+
+
+class FramePresenter:
+    """
+        Shows photos and video frames on a label through one screen-sized PhotoImage
+
+        Frames are letterboxed (centered on black) into a preallocated canvas, unpacked
+        into a block image of the PhotoImage mode and blitted with paste: no PhotoImage,
+        PIL image nor buffer is created per frame.
+    """
+
+    def __init__(self, label, width: int, height: int) -> None:
+        self.label = label
+        self.width, self.height = width, height
+        self._canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        self._canvas_image = _new_block_image("RGB", (width, height))
+        self._photo = ImageTk.PhotoImage("RGB", (width, height))
+        self._box = None  # (x, y, w, h) of content in canvas
+        self.has_frame = False
+
+    def __letterbox(self, array):
+        h, w = min(array.shape[0], self.height), min(array.shape[1], self.width)
+        box = ((self.width - w) // 2, (self.height - h) // 2, w, h)
+        if box != self._box:
+            # borders of the previous frame
+            self._canvas.fill(0)
+            self._box = box
+        x, y = box[0], box[1]
+        self._canvas[y:y + h, x:x + w] = array[:h, :w, :3] if array.ndim == 3 else array[:h, :w, None]
+
+    def __present(self):
+        # decoded in place, same mode as the PhotoImage
+        self._canvas_image.frombytes(self._canvas)
+        self._photo.paste(self._canvas_image)
+        if not self.has_frame:
+            self.label.configure(image=self._photo)
+            self.label.image = self._photo
+            self.has_frame = True
+
+    def present_array(self, array):
+        """
+            :param array: RGB frame of screen size or smaller
+        """
+        self.__letterbox(array)
+        self.__present()
+
+    def present_image(self, pil_image: Image):
+        """
+            :param pil_image: image fitted to screen
+        """
+        if pil_image.mode != "RGB":
+            pil_image = pil_image.convert("RGB")
+        self.present_array(np.asarray(pil_image))
+
+    def get_frame(self):
+        """
+            Returns view (height, width, 3) of the frame displayed
+        """
+        return self._canvas
@@ -1,22 +1,40 @@
-from os import path, listdir
-import base64
+import json
+from os import makedirs, path, replace
 import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import local
 from google.auth.exceptions import RefreshError
-from google.auth.transport.requests import Request
+from google.auth.transport.requests import AuthorizedSession, Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build, build_from_document
 from googleapiclient.errors import Error, HttpError
 import src.helper as hlpr
 from src.logger import Logger
+from src.metrics import metrics
+from src.media_catalog import MediaCatalog, MediaSource
+from src.attachment_writer import Base64FileWriter, iter_json_string_field
 from datetime import datetime as dt
 
 
 class GmailApi():
     # If modifying these scopes, delete the file token.json.
     SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
+    STATE_HISTORY_ID = "gmail_history_id"
+    BATCH_SIZE = 50  # max recommended by Gmail API
+    MAX_RETRIES = 3
+    # partial response, only what is needed to download attachments
+    MESSAGE_FIELDS = "id,internalDate,payload/parts(partId,filename,mimeType,body/attachmentId)"
+    ATTACHMENT_URL = "https://gmail.googleapis.com/gmail/v1/users/{}/messages/{}/attachments/{}"
+    DISCOVERY_URL = "https://gmail.googleapis.com/$discovery/rest?version=v1"
+    DISCOVERY_FILE_NAME = "gmail_v1_discovery.json"  # in cache folder, service built without network
 
-    def __init__(self, outpath: str, label_id: str) -> None:
+    def __init__(self, outpath: str, label_id: str, catalog: MediaCatalog = None, download_workers: int = 4,
+                 attachment_chunk_bytes: int = 1024 * 1024) -> None:
+        """
+            :param download_workers: number of attachments downloaded at the same time
+            :param attachment_chunk_bytes: memory used to download an attachment, whatever its size
+        """
         if not outpath:
             raise Error(f"outpath invalid [{outpath}]")
         if outpath.find("attachments") > 0:
@@ -26,72 +44,149 @@ class GmailApi():
         self._label_id = label_id
         self.logger = Logger(self.__class__.__name__)
         hlpr.create_attachments_path(self.project_path)
+        self.catalog = catalog if catalog else MediaCatalog(self.project_path)
+        self.download_workers = max(1, download_workers)
+        self.attachment_chunk_bytes = attachment_chunk_bytes
+        self._thread_local = local()
+        self._creds = None
         self.service = self.__get_service()
 
-    def __download_attachments(self, user_id, msg):
-        msg_id = ""
-        try:
-            path_files_downloaded = []
-            msg_id = msg["id"]
-            self.logger.info("__download_attachments", "Start", f"Message_id[{msg_id}]")
-            message = self.service.users().messages().get(userId=user_id, id=msg_id).execute()
-            if message:
+    def __get_session(self):
+        """
+            Returns authorized session of current thread
+        """
+        session = getattr(self._thread_local, "session", None)
+        if session is None:
+            session = AuthorizedSession(self._creds)
+            self._thread_local.session = session
+        return session
+
+    def __write_attachment(self, user_id, msg_id, att_id, filepath):
+        """
+            Streams attachment to filepath, base64 data is decoded by chunks
+        """
+        url = self.ATTACHMENT_URL.format(user_id, msg_id, att_id)
+        with self.__get_session().get(url, params={"fields": "data"}, stream=True, timeout=60) as res:
+            res.raise_for_status()
+            with Base64FileWriter(filepath, self.attachment_chunk_bytes) as writer:
+                for data in iter_json_string_field(res.iter_content(self.attachment_chunk_bytes), "data"):
+                    writer.write(data)
+        return writer.size
+
+    def __get_messages(self, user_id, msg_ids):
+        """
+            Gets messages with batch requests, only with fields needed to download attachments
+            Returns dict msg_id -> message, failed messages are missing
+        """
+        messages = {}
+        pending = list(msg_ids)
+        for retry_count in range(self.MAX_RETRIES):
+            if not pending:
+                break
+            if retry_count > 0:
+                delay = hlpr.get_backoff_delay_s(retry_count)
+                self.logger.info("__get_messages", f"{len(pending)} message(s) failed, retry in {delay:.1f}s")
+                time.sleep(delay)
+            failed = []
+
+            def callback(request_id, response, exception):
+                if exception is not None:
+                    self.logger.error("__get_messages", f"Message[{request_id}]", exception)
+                    failed.append(request_id)
+                else:
+                    messages[request_id] = response
+
+            for i in range(0, len(pending), self.BATCH_SIZE):
+                chunk = pending[i:i + self.BATCH_SIZE]
+                batch = self.service.new_batch_http_request(callback=callback)
+                for msg_id in chunk:
+                    batch.add(self.service.users().messages().get(userId=user_id, id=msg_id,
+                                                                  fields=self.MESSAGE_FIELDS), request_id=msg_id)
+                try:
+                    batch.execute()
+                except Exception as e:
+                    self.logger.error("__get_messages", "batch Exception", e)
+                    failed.extend([m for m in chunk if m not in messages and m not in failed])
+            pending = failed
+
+        return messages
+
+    def __get_attachments_parts(self, message):
+        """
+            Returns [(part, extension)] of attachments with a valid extension
+        """
+        parts = []
+        for part in message.get('payload', {}).get('parts', []):
+            if 'filename' in part and part['filename'] and part['mimeType'] != 'text/plain':
+                if 'attachmentId' in part.get('body', {}):
+                    ext = hlpr.get_file_extension_if_valid(part['filename'])
+                    if not ext:
+                        self.logger.info("__get_attachments_parts", f"Bad file extension[{part['filename']}]")
+                        continue
+                    parts.append((part, ext))
+        return parts
+
+    def __download_attachment(self, user_id, msg_id, msg_date, count_attachments, part, ext):
+        """
+            Returns path of the file downloaded, None if failed
+        """
+        att_id = part['body']['attachmentId']
+        filename = msg_id + "_" + msg_date + "_" + str(count_attachments) + ext
+        filepath = path.join(hlpr.get_path_attachments(self.project_path), filename)
+        self.logger.info("__download_attachment",
+                         f"Getting attachment: Message[{msg_id}], partId[{part['partId']}], name[{part['filename']}]...")
+        for retry_count in range(self.MAX_RETRIES):
+            if retry_count > 0:
+                delay = hlpr.get_backoff_delay_s(retry_count)
+                self.logger.info("__download_attachment", f"Waiting {delay:.1f}s before retry: {retry_count}")
+                time.sleep(delay)
+            try:
+                size = self.__write_attachment(user_id, msg_id, att_id, filepath)
+                metrics.increment("sync_gmail_files")
+                metrics.increment("sync_gmail_bytes", size)
+                self.catalog.add(filename, MediaSource.GMAIL, msg_id, int(msg_date))
+                self.logger.info("__download_attachment", f"filename[{filename}] downloaded, {size} bytes",
+                                 f"attachment: partId[{part['partId']}], name[{part['filename']}]")
+                return filepath
+            except Exception as e:
+                self.logger.error("__download_attachment", "attchment Exception", e)
+        return None
+
+    def __download_attachments(self, user_id, messages):
+        """
+            Downloads attachments of messages on a pool of download_workers threads
+            Returns files downloaded, and False if some messages or attachments failed
+        """
+        msg_ids = [m["id"] for m in messages]
+        messages_by_id = self.__get_messages(user_id, msg_ids)
+        all_downloaded = len(messages_by_id) == len(msg_ids)
+        futures = []
+        nb_already_downloaded = 0
+        with ThreadPoolExecutor(max_workers=self.download_workers, thread_name_prefix="gmail") as executor:
+            for msg_id in msg_ids:
+                message = messages_by_id.get(msg_id)
+                if not message:
+                    continue
                 msg_date = message["internalDate"]
-                count_attachments = 0
                 self.logger.info("__download_attachments",
                                  f"Message[{msg_id}], {dt.fromtimestamp(int(msg_date) / 1000)}")
-                for part in message['payload']['parts']:
-                    if 'filename' in part and part['filename'] and part['mimeType'] != 'text/plain':
-                        if 'attachmentId' in part['body']:
-                            att_id = part['body']['attachmentId']
-                            self.logger.info("__download_attachments",
-                                             f"Getting attachment: partId[{part['partId']}], name[{part['filename']}]...")
-                            att = None
-                            retry_count = 0
-                            while retry_count >= 0 and retry_count < 3:
-                                try:
-                                    att = self.service.users().messages().attachments().get(userId=user_id,
-                                                                                            messageId=msg_id,
-                                                                                            id=att_id).execute()
-                                    retry_count = -1
-                                except HttpError as error:
-                                    self.logger.error("__download_attachments", "attchment HttpError", error)
-                                    retry_count += 1
-                                except Exception as e:
-                                    self.logger.error("__download_attachments", "attchment Exception", e)
-                                    retry_count += 1
-                                if retry_count > 0 and retry_count < 3:
-                                    self.logger.info("__download_attachments", "Waiting before next try...")
-                                    time.sleep(10)
-                                    self.logger.info("__download_attachments", f"...retry: {retry_count}")
-                            if att and 'data' in att:
-                                ext = hlpr.get_file_extension_if_valid(part['filename'])
-                                if not ext:
-                                    self.logger.info("__download_attachments",
-                                                     f"Bad file extension[{part['filename']}]")
-                                    continue
-                                count_attachments += 1
-                                file_data = base64.urlsafe_b64decode(att['data'].encode('UTF-8'))
-                                filename = msg_id + "_" + msg_date + "_" + str(count_attachments) + ext
-                                filepath = path.join(hlpr.get_path_attachments(self.project_path), filename)
-                                with open(filepath, "wb") as f:
-                                    f.write(file_data)
-                                path_files_downloaded.append(filepath)
-                                self.logger.info("__download_attachments", f"filename[{filename}] downloaded",
-                                                 f"attachment: partId[{part['partId']}], name[{part['filename']}]")
-                            else:
-                                self.logger.info("__download_attachments", "attachment not found", att)
-                return path_files_downloaded
+                for count_attachments, (part, ext) in enumerate(self.__get_attachments_parts(message), start=1):
+                    # attachments failed in a previous sync are downloaded again, the others are skipped
+                    if self.catalog.has_file(msg_id + "_" + msg_date + "_" + str(count_attachments) + ext):
+                        nb_already_downloaded += 1
+                        continue
+                    futures.append(executor.submit(self.__download_attachment, user_id, msg_id, msg_date,
+                                                   count_attachments, part, ext))
+        path_files_downloaded = []
+        for future in futures:
+            filepath = future.result()
+            if filepath:
+                path_files_downloaded.append(filepath)
             else:
-                self.logger.warning("__download_attachments", "message null", message)
-        except HttpError as error:
-            self.logger.error("__download_attachments", "HttpError", error)
-        except Exception as e:
-            self.logger.error("__download_attachments", "Exception", e)
-        finally:
-            self.logger.info("__download_attachments", "End", f"Message_id[{msg_id}]")
-
-        return None
+                all_downloaded = False
+        if nb_already_downloaded:
+            self.logger.info("__download_attachments", f"{nb_already_downloaded} attachment(s) already downloaded")
+        return path_files_downloaded, all_downloaded
 
     def __get_service(self):
         """Shows basic usage of the Gmail API.
@@ -130,9 +225,10 @@ class GmailApi():
             with open(p_token, 'w') as token:
                 token.write(creds.to_json())
 
+        self._creds = creds
         try:
             # Call the Gmail API
-            service = build('gmail', 'v1', credentials=creds)
+            service = self.__build_service(creds)
             return service
             # https://stackoverflow.com/questions/25832631/download-attachments-from-gmail-using-gmail-api
 
@@ -141,7 +237,35 @@ class GmailApi():
         except Exception as e:
             self.logger.error("__get_service", "Exception, build", e)
 
+    def __build_service(self, creds):
+        """
+            Builds service from the discovery document cached in project folder,
+            the document is fetched and cached the first time
+        """
+        p = path.join(self.project_path, "cache", self.DISCOVERY_FILE_NAME)
+        if path.exists(p):
+            try:
+                with open(p, "r", encoding="UTF-8") as f:
+                    return build_from_document(f.read(), credentials=creds)
+            except Exception as e:
+                self.logger.warning("__build_service", "invalid cached discovery document, fetching it", e)
+        try:
+            res = AuthorizedSession(creds).get(self.DISCOVERY_URL, timeout=30)
+            res.raise_for_status()
+            document = res.json()
+            makedirs(path.dirname(p), exist_ok=True)
+            with open(p + ".tmp", "w", encoding="UTF-8") as f:
+                json.dump(document, f)
+            replace(p + ".tmp", p)
+            return build_from_document(document, credentials=creds)
+        except Exception as e:
+            self.logger.warning("__build_service", "can't fetch discovery document", e)
+        return build('gmail', 'v1', credentials=creds)
+
     def __get_messages_in_label_cadre_photo(self):
+        """
+            Returns messages in label within last 3 weeks, and False if listing failed (list incomplete)
+        """
         fetch = True
         messages_list = []
         nextPageToken = None
@@ -168,40 +292,91 @@ class GmailApi():
                              f"{len(messages_list)} message(s) found in label since {d_3w_before}")
         except HttpError as error:
             self.logger.error("__get_messages_in_label_cadre_photo", "HttpError", error)
+            return messages_list, False
         except Exception as error:
             self.logger.error("__get_messages_in_label_cadre_photo", "Exception", error)
+            return messages_list, False
 
-        return messages_list
-
-    def __is_message_already_downloaded(self, msg_id, files_downloaded):
-        for f in files_downloaded:
-            if f.startswith(msg_id):
-                return True
-        return False
-
-    def __remove_messages_if_exists(self, messages):
-        filtered_messages = []
-        if messages:
-            files_downloaded = listdir(hlpr.get_path_attachments(self.project_path))
-            if messages and len(messages) > 0:
-                for m in messages:
-                    id = m['id']
-                    if not self.__is_message_already_downloaded(id, files_downloaded):
-                        filtered_messages.append(m)
-            self.logger.info("__remove_messages_if_exists", f"{len(filtered_messages)} new message(s)")
-        return filtered_messages
+        return messages_list, True
+
+    def __get_current_history_id(self):
+        try:
+            profile = self.service.users().getProfile(userId="me").execute()
+            return profile["historyId"]
+        except HttpError as error:
+            self.logger.error("__get_current_history_id", "HttpError", error)
+        except Exception as error:
+            self.logger.error("__get_current_history_id", "Exception", error)
+        return None
+
+    def __get_messages_since_history_id(self, start_history_id):
+        """
+            Returns messages added to label since start_history_id, and the last history id
+            Returns None, None if start_history_id is expired (full sync needed),
+            [], None on other errors (same history id tried again next sync)
+        """
+        messages_list = []
+        message_ids = set()
+        history_id = start_history_id
+        nextPageToken = None
+        try:
+            while True:
+                history = self.service.users().history().list(userId="me", startHistoryId=start_history_id,
+                                                              labelId=self._label_id,
+                                                              historyTypes=["messageAdded", "labelAdded"],
+                                                              maxResults=500, pageToken=nextPageToken).execute()
+                for record in history.get("history", []):
+                    added = record.get("messagesAdded", []) + record.get("labelsAdded", [])
+                    for a in added:
+                        msg = a["message"]
+                        if self._label_id in msg.get("labelIds", []) and msg["id"] not in message_ids:
+                            message_ids.add(msg["id"])
+                            messages_list.append(msg)
+                history_id = history.get("historyId", history_id)
+                nextPageToken = history.get("nextPageToken")
+                if not nextPageToken:
+                    break
+            self.logger.info("__get_messages_since_history_id",
+                             f"{len(messages_list)} message(s) added to label since history[{start_history_id}]")
+            return messages_list, history_id
+        except HttpError as error:
+            if error.resp.status == 404:
+                self.logger.warning("__get_messages_since_history_id",
+                                    f"history[{start_history_id}] expired, full sync needed")
+                return None, None
+            self.logger.error("__get_messages_since_history_id", "HttpError", error)
+        except Exception as error:
+            self.logger.error("__get_messages_since_history_id", "Exception", error)
+
+        return [], None
 
     def download_new_images(self):
+        """
+            Incremental sync from the last history id saved in catalog,
+            full sync of the last 3 weeks if there is none or if it is expired
+        """
+        if self.service is None:
+            # offline when created
+            self.service = self.__get_service()
         if self.service:
-            messages = self.__get_messages_in_label_cadre_photo()
+            messages, history_id = None, None
+            last_history_id = self.catalog.get_state(self.STATE_HISTORY_ID)
+            if last_history_id:
+                messages, history_id = self.__get_messages_since_history_id(last_history_id)
+            all_downloaded = True
+            if messages is None:
+                # history id taken before listing, changes during listing will be in next sync
+                history_id = self.__get_current_history_id()
+                messages, all_downloaded = self.__get_messages_in_label_cadre_photo()
+            new_files = []
             if messages:
-                new_messages = self.__remove_messages_if_exists(messages)
-                new_files = []
-                for msg in new_messages:
-                    new_downloads = self.__download_attachments("me", msg)
-                    if new_downloads:
-                        new_files.extend(new_downloads)
-                return new_files
+                # attachments already in catalog are skipped, per attachment
+                new_files, downloaded = self.__download_attachments("me", messages)
+                all_downloaded = all_downloaded and downloaded
+            # failed listings, messages and attachments are fetched again next sync
+            if history_id and all_downloaded:
+                self.catalog.set_state(self.STATE_HISTORY_ID, str(history_id))
+            return new_files
         return None
 
     def get_all_labels(self):
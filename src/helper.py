@@ -1,6 +1,12 @@
 from datetime import datetime as dt, timedelta
-from os import path, mkdir
+from os import path, mkdir, makedirs, listdir, stat
+import hashlib
+import shutil
 import pytz
+from src.logger import Logger
+from src.metrics import metrics
+
+logger = Logger("hlpr")
 
 
 def _is_valid_extension_for_image(ext: str) -> bool:
@@ -48,24 +54,41 @@ def is_valid_image_file(filename):
     return False
 
 
-def is_new_image(imageName):
+def parse_media_filename(filename):
+    """
+        remote_id + _ + epoch_ms + _ + ... + extension
+
+        Returns remote_id, epoch_ms (None, None if filename isn't valid)
+    """
+    filename = path.basename(filename)
+    if filename and len(filename.split("_")) > 2:
+        parts = filename.split("_")
+        try:
+            return parts[0], int(parts[1])
+        except ValueError as e:
+            logger.debug("parse_media_filename", f"parsing error[{filename}]", e)
+    return None, None
+
+
+def is_new_image(imageName, timestamp_ms=None):
     """
+        :param timestamp_ms: date of the file (from catalog), parsed from imageName if None
+
         returns True if today - date < 24h
         False otherwise
     """
     EXPIRATION_NEW = timedelta(hours=24)  # 12h
-    filename = path.basename(imageName)
-    if filename and len(filename.split("_")) > 2:
-        date = filename.split("_")[1]
-        tmstp = -1
+    if timestamp_ms is None:
+        _, timestamp_ms = parse_media_filename(imageName)
+    if timestamp_ms is not None:
         try:
-            tmstp = int(date) / 1000  # ajouter check longueur
+            tmstp = timestamp_ms / 1000  # ajouter check longueur
             if (dt.now() - dt.fromtimestamp(tmstp)) < EXPIRATION_NEW:
                 return True
         except Exception as e:
             print("is_new_image - parsing error: ", e)
 
-        return False
+    return False
 
 
 # region Date & time
@@ -91,38 +114,152 @@ def get_date_yyyymmdd_minus_3_weeks():
     return (dt.now() - timedelta(weeks=3)).strftime("%Y/%m/%d")
 
 
+# endregion
+
+# region Retry
+
+import random
+
+
+def get_backoff_delay_s(retry_count, base_s=1, max_s=60):
+    """
+        Exponential backoff with full jitter
+    """
+    return random.uniform(0, min(max_s, base_s * 2 ** retry_count))
+
+
+# endregion
+
+# region Image
+
+from PIL import Image, ExifTags
+
+EXIF_ORIENTATION = next((k for k, v in ExifTags.TAGS.items() if v == "Orientation"), None)
+
+
+def get_image_orientation(pil_image) -> int:
+    """
+        Returns EXIF orientation (1 if unknown)
+    """
+    try:
+        exif = pil_image._getexif()
+        if exif and EXIF_ORIENTATION in exif:
+            return exif[EXIF_ORIENTATION]
+    except (AttributeError, KeyError, IndexError):
+        # cases: image don't have getexif
+        pass
+    return 1
+
+
+def apply_orientation(pil_image, orientation: int):
+    if orientation == 3:
+        return pil_image.rotate(180, expand=True)
+    elif orientation == 6:
+        return pil_image.rotate(270, expand=True)
+    elif orientation == 8:
+        return pil_image.rotate(90, expand=True)
+    return pil_image
+
+
+def open_image_oriented(file_path, fit_width=None, fit_height=None, orientation=None):
+    """
+        Opens image and rotates it according to its EXIF orientation
+
+        :param fit_width, fit_height: size the image will be fitted in. JPEG images are then
+            decoded at the smallest DCT scale (1/2, 1/4, 1/8) still larger than the fitted size
+        :param orientation: EXIF orientation if already known, EXIF isn't read
+    """
+    pil_image = Image.open(file_path)
+    if orientation is None:
+        orientation = get_image_orientation(pil_image)
+    if fit_width and fit_height and pil_image.format == "JPEG":
+        # image is rotated after decoding
+        if orientation in (5, 6, 7, 8):
+            fit_width, fit_height = fit_height, fit_width
+        pil_image.draft(pil_image.mode, get_size_to_fit(pil_image.size[0], pil_image.size[1], fit_width, fit_height))
+    return apply_orientation(pil_image, orientation)
+
+
+def get_size_to_fit(img_width, img_height, max_width, max_height):
+    """
+        Returns (width, height) keeping ratio, to fit in max_width x max_height
+    """
+    ratio = min(max_width / img_width, max_height / img_height)
+    return int(img_width * ratio), int(img_height * ratio)
+
+
+def resize_to_fit(pil_image, max_width, max_height):
+    size = get_size_to_fit(pil_image.size[0], pil_image.size[1], max_width, max_height)
+    if pil_image.size == size:
+        return pil_image
+    return pil_image.resize(size, Image.ANTIALIAS)
+
+
+def load_image_to_fit(file_path, max_width, max_height, orientation=None):
+    """
+        Returns image oriented and scaled to fit in max_width x max_height
+    """
+    with metrics.span("decode"):
+        pil_image = open_image_oriented(file_path, max_width, max_height, orientation)
+        pil_image.load()
+    with metrics.span("resize"):
+        pil_image = resize_to_fit(pil_image, max_width, max_height)
+    return pil_image
+
+
 # endregion
 
 # region Video
 
-import cv2
+def is_frame_kept(index, src_fps, max_fps=None) -> bool:
+    """
+        Decimates a video from src_fps to max_fps, by frame timestamps
+        Returns True if frame at index is kept
+    """
+    if not max_fps or src_fps <= max_fps or index == 0:
+        return True
+    return int(index * max_fps / src_fps) != int((index - 1) * max_fps / src_fps)
 
 
-def get_video_infos(file_path):
+def get_video_fps(src_fps, max_fps=None):
+    """
+        Returns fps once decimated to max_fps
+    """
+    if max_fps and src_fps > max_fps:
+        return max_fps
+    return src_fps
+
+
+def get_video_infos(file_path, max_fps=None):
     """
         Returns error, frames, fps
+        Frames are decimated to max_fps
     """
+    import cv2
     MAX_FRAMES = 500
     error, frames, fps = None, [], 0
     i = 0
+    cap = None
     try:
         cap = cv2.VideoCapture(file_path)
         if not cap.isOpened():
             error = "not isOpened"
         else:
-            fps = cap.get(cv2.CAP_PROP_FPS)
+            src_fps = cap.get(cv2.CAP_PROP_FPS)
+            fps = get_video_fps(src_fps, max_fps)
             # total_frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
             while cap.isOpened():
-                ret, frame = cap.read()
-                if ret:
-                    # take 1 out of 2 frames
-                    if i % 2 == 0:
+                if is_frame_kept(i, src_fps, max_fps):
+                    ret, frame = cap.read()
+                    if ret:
                         frames.append(frame)
                         if len(frames) > MAX_FRAMES:
                             break
-                    i += 1
                 else:
+                    ret = cap.grab()
+                if not ret:
                     break
+                i += 1
 
     except Exception as e:
         frames = []
@@ -151,4 +288,33 @@ def create_attachments_path(projectPath):
         mkdir(p)
         print("hlpr.create_attachments_path", f"Path created")
 
+
+def get_path_quarantine(projectPath):
+    return path.join(projectPath, "quarantine")
+
+
+def get_file_key(file_path, *extra) -> str:
+    """
+        Returns a key identifying the file content (path, size, modification time)
+    """
+    st = stat(file_path)
+    identity = "|".join([path.abspath(file_path), str(st.st_size), str(st.st_mtime_ns)] + [str(e) for e in extra])
+    return hashlib.sha1(identity.encode("UTF-8")).hexdigest()
+
+
+def get_path_cache(projectPath, name, width, height):
+    """
+        Returns cache folder of screen size width x height (cache/<name>/<width>x<height>)
+        Folders of other screen sizes are removed
+    """
+    root = path.join(projectPath, "cache", name)
+    p = path.join(root, f"{width}x{height}")
+    makedirs(p, exist_ok=True)
+    for d in listdir(root):
+        old = path.join(root, d)
+        if old != p and path.isdir(old):
+            logger.warning("get_path_cache", f"screen size changed, removing {old}...")
+            shutil.rmtree(old, ignore_errors=True)
+    return p
+
 # endregion
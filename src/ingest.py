@@ -0,0 +1,136 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from os import cpu_count, makedirs, path, replace
+from src.logger import Logger
+from src.media_catalog import MediaCatalog, MediaStatus
+from src.media_metadata import MEDIA_TYPE_IMAGE, extract_metadata
+from src.metrics import metrics
+from src.rendition_cache import RenditionCache, save_rendition
+import src.helper as hlpr
+
+
+def validate_media(file_path, width: int, height: int, rendition_path: str, quality: int):
+    """
+        Runs in a worker process: decode check, then for photos writes the rendition
+        oriented and fitted to width x height in rendition_path
+
+        Returns (MediaMetadata or None, error or None)
+    """
+    metadata = extract_metadata(file_path)
+    if metadata is None:
+        return None, "not a photo or a video"
+    if not metadata.decode_ok:
+        return metadata, f"can't decode {metadata.media_type}"
+    if metadata.media_type == MEDIA_TYPE_IMAGE:
+        try:
+            pil_image = hlpr.load_image_to_fit(file_path, width, height, metadata.orientation)
+            save_rendition(pil_image, rendition_path, quality)
+        except Exception as e:
+            return metadata._replace(decode_ok=False), f"can't render image ({e})"
+    return metadata, None
+
+
+class IngestPipeline:
+    """
+        Validates new photos and videos before they reach the playlist
+
+        Files are checked on a process pool (one process per core): images are
+        fully decoded and their rendition written to the rendition cache, videos
+        are opened and a first frame is read. Files failing are moved to the
+        quarantine folder and get QUARANTINED status, so they aren't shown nor
+        downloaded again. Files no longer on disk get MISSING status.
+    """
+
+    def __init__(self, project_path: str, catalog: MediaCatalog, rendition_cache: RenditionCache,
+                 workers: int = None) -> None:
+        self.logger = Logger(self.__class__.__name__)
+        self.catalog = catalog
+        self.rendition_cache = rendition_cache
+        self.quarantine_folder = hlpr.get_path_quarantine(project_path)
+        self.workers = max(1, workers or cpu_count() or 1)
+
+    def __quarantine(self, file_path, metadata, error):
+        filename = path.basename(file_path)
+        self.logger.warning("__quarantine", f"[{filename}] quarantined: {error}")
+        try:
+            makedirs(self.quarantine_folder, exist_ok=True)
+            replace(file_path, path.join(self.quarantine_folder, filename))
+        except Exception as e:
+            self.logger.error("__quarantine", f"can't move[{filename}]", e)
+        if metadata:
+            self.catalog.set_metadata(file_path, metadata)
+        self.catalog.set_status(file_path, MediaStatus.QUARANTINED)
+
+    def __on_result(self, file_path, metadata, error) -> bool:
+        if error:
+            self.__quarantine(file_path, metadata, error)
+            return False
+        self.catalog.set_metadata(file_path, metadata)
+        if metadata.media_type == MEDIA_TYPE_IMAGE:
+            try:
+                self.rendition_cache.register(file_path)
+            except Exception as e:
+                self.logger.warning("__on_result", f"rendition not registered[{path.basename(file_path)}]", e)
+        return True
+
+    def __validate(self, files, workers: int):
+        """
+            Validates files on a pool of workers processes
+            Returns (results [(file_path, metadata, error)], files not validated because a worker died)
+        """
+        results, pending = [], []
+        # spawn: forking the Tk process with its threads isn't safe
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = {}
+            for f in files:
+                try:
+                    rendition_path = self.rendition_cache.get_rendition_path(f)
+                    futures[executor.submit(validate_media, f, self.rendition_cache.width,
+                                            self.rendition_cache.height, rendition_path,
+                                            self.rendition_cache.JPEG_QUALITY)] = f
+                except FileNotFoundError:
+                    # removed by hand: out of playlist and of next batches
+                    self.logger.warning("__validate", f"[{path.basename(f)}] missing, removed from catalog")
+                    self.catalog.set_status(f, MediaStatus.MISSING)
+                    continue
+                except BrokenProcessPool:
+                    pending.append(f)
+            for future in as_completed(futures):
+                file_path = futures[future]
+                try:
+                    metadata, error = future.result()
+                except BrokenProcessPool:
+                    pending.append(file_path)
+                    continue
+                except Exception as e:
+                    # validate_media raised, or its result couldn't be sent back
+                    metadata, error = None, f"validation failed ({e})"
+                results.append((file_path, metadata, error))
+        return results, pending
+
+    def run(self, files) -> int:
+        """
+            Validates files, returns number of files quarantined
+
+            When a worker dies (decoder abort...), files not validated yet are validated
+            again one per pool, the file whose worker dies is quarantined
+        """
+        if not files:
+            return 0
+        results, pending = self.__validate(files, min(self.workers, len(files)))
+        if pending:
+            self.logger.warning("run", f"a worker died, {len(pending)} file(s) validated one at a time")
+            for f in pending:
+                file_results, broken = self.__validate([f], 1)
+                results += file_results
+                results += [(b, None, "worker died validating file") for b in broken]
+        quarantined = 0
+        for file_path, metadata, error in results:
+            if not self.__on_result(file_path, metadata, error):
+                quarantined += 1
+        metrics.increment("ingest_files", len(results))
+        metrics.increment("ingest_quarantined", quarantined)
+        self.logger.info("run", f"{len(results)} file(s) validated, {quarantined} quarantined")
+        return quarantined
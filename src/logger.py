@@ -1,5 +1,11 @@
 from enum import Enum
 from datetime import datetime as dt
+from os import getenv, path, rename, remove
+from queue import Queue, Full, Empty
+from threading import Lock, Thread
+import atexit
+import sys
+import time
 
 
 class Level(Enum):
@@ -9,13 +15,142 @@ class Level(Enum):
     ERROR = 4
 
 
+# Level values aren't ordered by severity
+SEVERITIES = {Level.DEBUG: 10, Level.INFO: 20, Level.WARNING: 30, Level.ERROR: 40}
+
+DEFAULT_LEVEL = "INFO"
+DEFAULT_MAX_BYTES = 1024 * 1024 * 5  # 5MB
+DEFAULT_BACKUP_COUNT = 3
+QUEUE_SIZE = 10000  # messages dropped above, the caller never waits
+
+
+class _LogWriter(Thread):
+    """
+        Formats and writes messages queued by Logger, on its own thread
+
+        Writes to stdout, or to file_path rotated once max_bytes is reached
+        (file.1 ... file.backup_count)
+    """
+
+    def __init__(self, file_path: str = None, max_bytes: int = DEFAULT_MAX_BYTES,
+                 backup_count: int = DEFAULT_BACKUP_COUNT) -> None:
+        super().__init__(name="logger", daemon=True)
+        self.file_path = file_path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.queue = Queue(QUEUE_SIZE)
+        self.dropped = 0
+        self._file = None
+        self._size = 0
+
+    def __open(self):
+        self._file = open(self.file_path, "a", encoding="UTF-8")
+        self._size = self._file.tell()
+
+    def __rotate(self):
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            if path.exists(f"{self.file_path}.{i}"):
+                rename(f"{self.file_path}.{i}", f"{self.file_path}.{i + 1}")
+        if self.backup_count > 0:
+            rename(self.file_path, f"{self.file_path}.1")
+        else:
+            remove(self.file_path)
+        self.__open()
+
+    def __format(self, record) -> str:
+        timestamp, level, caller, message, args = record
+        date = dt.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+        return " ".join([date, level.name.rjust(8, " "), "-", caller, ":", str(message)] + [str(a) for a in args])
+
+    def __write(self, lines):
+        text = "\n".join(lines) + "\n"
+        if self._file is None:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+            return
+        self._file.write(text)
+        self._file.flush()
+        self._size += len(text)
+        if self._size >= self.max_bytes:
+            self.__rotate()
+
+    def run(self):
+        if self.file_path:
+            self.__open()
+        running = True
+        while running:
+            records = [self.queue.get()]
+            # drains what was queued meanwhile, written at once
+            while True:
+                try:
+                    records.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            lines = []
+            for record in records:
+                if record is None:
+                    running = False
+                    continue
+                try:
+                    lines.append(self.__format(record))
+                except Exception as e:
+                    lines.append(f"_LogWriter.run : can't format message {e!r}")
+            if self.dropped > 0:
+                lines.append(f"_LogWriter.run : {self.dropped} message(s) dropped, queue full")
+                self.dropped = 0
+            try:
+                if lines:
+                    self.__write(lines)
+            except Exception as e:
+                sys.stderr.write(f"_LogWriter.run : can't write log {e!r}\n")
+        if self._file:
+            self._file.close()
+
+    def put(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+    def stop(self, timeout_s: float = 2):
+        """
+            Writes pending messages and stops
+        """
+        self.queue.put(None)
+        self.join(timeout_s)
+
+
+_writer = None
+_threshold = None
+_init_lock = Lock()
+
+
+def _get_writer():
+    """
+        Starts writer on first message, after .env file is loaded
+
+        LOG_LEVEL: DEBUG, INFO, WARNING or ERROR
+        LOG_FILE: log file path, stdout if not set
+        LOG_MAX_BYTES, LOG_BACKUP_COUNT: rotation of LOG_FILE
+    """
+    global _writer, _threshold
+    with _init_lock:
+        if _writer is None:
+            level = Level.__members__.get(getenv("LOG_LEVEL", DEFAULT_LEVEL).upper(), Level.INFO)
+            _threshold = SEVERITIES[level]
+            _writer = _LogWriter(getenv("LOG_FILE") or None,
+                                 int(getenv("LOG_MAX_BYTES", DEFAULT_MAX_BYTES)),
+                                 int(getenv("LOG_BACKUP_COUNT", DEFAULT_BACKUP_COUNT)))
+            _writer.start()
+            atexit.register(_writer.stop)
+    return _writer
+
+
 class Logger:
     def __init__(self, callerClass: str) -> None:
         self.callerClass = callerClass
 
-    def __get_date(self) -> str:
-        return dt.now().strftime("%Y-%m-%d %H:%M:%S")
-
     def info(self, caller: str, message: str, *args):
         self.__log(Level.INFO, caller, message, *args)
 
@@ -29,12 +164,12 @@ class Logger:
         self.__log(Level.ERROR, caller, message, *args)
 
     def __log(self, level: Level, caller: str, message: str, *args):
+        writer = _writer or _get_writer()
+        if SEVERITIES[level] < _threshold:
+            return
         if self.callerClass:
             _caller = f"{self.callerClass}.{caller}"
         else:
             _caller = caller
-        if args and len(args) > 0:
-            print(self.__get_date(), level.name.rjust(8, " "), "-", _caller, ":", message, *args)
-        else:
-            print(self.__get_date(), level.name.rjust(8, " "), "-", _caller, ":", message)
-
+        # formatted on writer thread
+        writer.put((time.time(), level, _caller, message, args))
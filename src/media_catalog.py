@@ -0,0 +1,254 @@
+import sqlite3
+from enum import Enum
+from os import listdir, path
+from threading import Lock
+from src.logger import Logger
+from src.media_metadata import MediaMetadata
+import src.helper as hlpr
+
+HASH_BANDS = 4  # perceptual hash split in 4 indexed bands, band0..band3
+
+
+class MediaSource(Enum):
+    GMAIL = "gmail"
+    FIREBASE = "firebase"
+
+
+class MediaStatus(Enum):
+    ACTIVE = "active"
+    EVICTED = "evicted"  # removed to free space, not downloaded again
+    DUPLICATE = "duplicate"  # same photo/video as an active file
+    QUARANTINED = "quarantined"  # unreadable, moved to quarantine folder, not downloaded again
+    MISSING = "missing"  # removed from attachments folder by hand, not downloaded again
+
+
+class MediaCatalog:
+    """
+        SQLite catalog of the files in attachments folder
+
+        Replaces listdir scans: remote id lookups and playlist are indexed queries
+    """
+    DB_NAME = "catalog.db"
+
+    def __init__(self, project_path: str, migrate: bool = True) -> None:
+        """
+            :param migrate: False to call migrate() later (after the first slide)
+        """
+        self.logger = Logger(self.__class__.__name__)
+        self.project_path = project_path
+        self._lock = Lock()
+        self._db = sqlite3.connect(path.join(project_path, self.DB_NAME), check_same_thread=False)
+        self.__create_tables()
+        if migrate:
+            self.migrate()
+
+    def migrate(self):
+        if self.get_state("migrated") is None:
+            self.__migrate_from_folder()
+
+    def __create_tables(self):
+        with self._lock, self._db:
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS media (
+                    filename TEXT PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    remote_id TEXT NOT NULL,
+                    timestamp_ms INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    show_count INTEGER NOT NULL DEFAULT 0,
+                    last_shown_ms INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS idx_media_remote_id ON media (source, remote_id);
+                CREATE INDEX IF NOT EXISTS idx_media_status_timestamp ON media (status, timestamp_ms);
+                CREATE TABLE IF NOT EXISTS metadata (
+                    filename TEXT PRIMARY KEY,
+                    media_type TEXT NOT NULL,
+                    width INTEGER,
+                    height INTEGER,
+                    orientation INTEGER,
+                    capture_ms INTEGER,
+                    duration_s REAL,
+                    fps REAL,
+                    decode_ok INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS hashes (
+                    filename TEXT PRIMARY KEY,
+                    media_type TEXT NOT NULL,
+                    hash INTEGER,
+                    band0 INTEGER,
+                    band1 INTEGER,
+                    band2 INTEGER,
+                    band3 INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS idx_hashes_band0 ON hashes (band0);
+                CREATE INDEX IF NOT EXISTS idx_hashes_band1 ON hashes (band1);
+                CREATE INDEX IF NOT EXISTS idx_hashes_band2 ON hashes (band2);
+                CREATE INDEX IF NOT EXISTS idx_hashes_band3 ON hashes (band3);
+                CREATE TABLE IF NOT EXISTS state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            """)
+            # catalogs created by previous versions
+            columns = [r[1] for r in self._db.execute("PRAGMA table_info(media)")]
+            if "show_count" not in columns:
+                self._db.execute("ALTER TABLE media ADD COLUMN show_count INTEGER NOT NULL DEFAULT 0")
+            if "last_shown_ms" not in columns:
+                self._db.execute("ALTER TABLE media ADD COLUMN last_shown_ms INTEGER")
+
+    def __migrate_from_folder(self):
+        """
+            First run: fills catalog from filenames already downloaded
+        """
+        folder = hlpr.get_path_attachments(self.project_path)
+        count = 0
+        if path.exists(folder):
+            for filename in listdir(folder):
+                if not hlpr.get_file_extension_if_valid(filename):
+                    continue
+                remote_id, timestamp_ms = hlpr.parse_media_filename(filename)
+                if remote_id is None:
+                    continue
+                # firebase files start with blob generation (epoch in microseconds)
+                source = MediaSource.FIREBASE if remote_id.isdigit() else MediaSource.GMAIL
+                self.add(filename, source, remote_id, timestamp_ms)
+                count += 1
+        self.set_state("migrated", "1")
+        self.logger.info("__migrate_from_folder", f"{count} file(s) added to catalog")
+
+    def add(self, filename: str, source: MediaSource, remote_id: str, timestamp_ms: int,
+            status: MediaStatus = MediaStatus.ACTIVE):
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO media (filename, source, remote_id, timestamp_ms, status) "
+                             "VALUES (?, ?, ?, ?, ?)",
+                             (path.basename(filename), source.value, str(remote_id), int(timestamp_ms), status.value))
+
+    def has_remote_id(self, source: MediaSource, remote_id: str) -> bool:
+        with self._lock:
+            row = self._db.execute("SELECT 1 FROM media WHERE source = ? AND remote_id = ? LIMIT 1",
+                                   (source.value, str(remote_id))).fetchone()
+        return row is not None
+
+    def has_file(self, filename: str) -> bool:
+        with self._lock:
+            row = self._db.execute("SELECT 1 FROM media WHERE filename = ?", (path.basename(filename),)).fetchone()
+        return row is not None
+
+    def get_timestamp_ms(self, filename: str):
+        with self._lock:
+            row = self._db.execute("SELECT timestamp_ms FROM media WHERE filename = ?",
+                                   (path.basename(filename),)).fetchone()
+        return row[0] if row else None
+
+    def set_metadata(self, filename: str, metadata: MediaMetadata):
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO metadata (filename, media_type, width, height, orientation, "
+                             "capture_ms, duration_s, fps, decode_ok) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             (path.basename(filename), metadata.media_type, metadata.width, metadata.height,
+                              metadata.orientation, metadata.capture_ms, metadata.duration_s, metadata.fps,
+                              int(metadata.decode_ok)))
+
+    def get_metadata(self, filename: str):
+        """
+            Returns MediaMetadata, None if not extracted yet
+        """
+        with self._lock:
+            row = self._db.execute("SELECT media_type, width, height, orientation, capture_ms, duration_s, fps, "
+                                   "decode_ok FROM metadata WHERE filename = ?", (path.basename(filename),)).fetchone()
+        if row is None:
+            return None
+        return MediaMetadata(*row[:-1], decode_ok=bool(row[-1]))
+
+    def get_files_without_metadata(self, limit: int = None):
+        query = ("SELECT m.filename FROM media m LEFT JOIN metadata d ON d.filename = m.filename "
+                 "WHERE d.filename IS NULL AND m.status = ? ORDER BY m.timestamp_ms DESC")
+        params = (MediaStatus.ACTIVE.value,)
+        if limit:
+            query += " LIMIT ?"
+            params += (limit,)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        folder = hlpr.get_path_attachments(self.project_path)
+        return [path.join(folder, r[0]) for r in rows]
+
+    def get_playlist_entries(self):
+        """
+            Returns [(path, timestamp_ms, show_count)] of active files, most recent first
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT m.filename, m.timestamp_ms, m.show_count FROM media m "
+                                    "LEFT JOIN metadata d ON d.filename = m.filename "
+                                    "WHERE m.status = ? AND (d.decode_ok IS NULL OR d.decode_ok = 1) "
+                                    "ORDER BY m.timestamp_ms DESC", (MediaStatus.ACTIVE.value,)).fetchall()
+        folder = hlpr.get_path_attachments(self.project_path)
+        return [(path.join(folder, r[0]), r[1], r[2]) for r in rows]
+
+    def add_shown(self, shown):
+        """
+            :param shown: [(filename, shown_ms)], show count incremented for each
+        """
+        with self._lock, self._db:
+            self._db.executemany("UPDATE media SET show_count = show_count + 1, last_shown_ms = ? WHERE filename = ?",
+                                 [(int(shown_ms), path.basename(f)) for f, shown_ms in shown])
+
+    def get_eviction_candidates(self):
+        """
+            Returns [(filename, timestamp_ms, show_count, status)] of files on disk
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT filename, timestamp_ms, show_count, status FROM media "
+                                    "WHERE status IN (?, ?)",
+                                    (MediaStatus.ACTIVE.value, MediaStatus.DUPLICATE.value)).fetchall()
+        return [(f, ts, c, MediaStatus(s)) for f, ts, c, s in rows]
+
+    def get_files_without_hash(self, limit: int = None):
+        """
+            Returns path of active files not hashed yet, oldest first
+        """
+        query = ("SELECT m.filename FROM media m LEFT JOIN hashes h ON h.filename = m.filename "
+                 "WHERE h.filename IS NULL AND m.status = ? ORDER BY m.timestamp_ms")
+        params = (MediaStatus.ACTIVE.value,)
+        if limit:
+            query += " LIMIT ?"
+            params += (limit,)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        folder = hlpr.get_path_attachments(self.project_path)
+        return [path.join(folder, r[0]) for r in rows]
+
+    def set_hash(self, filename: str, media_type: str, h: int, bands):
+        """
+            :param h: 64 bits perceptual hash, None if file couldn't be hashed
+            :param bands: HASH_BANDS parts of h, indexed
+        """
+        bands = list(bands) if bands else [None] * HASH_BANDS
+        with self._lock, self._db:
+            # sqlite integers are signed 64 bits
+            self._db.execute("INSERT OR REPLACE INTO hashes (filename, media_type, hash, band0, band1, band2, band3) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             [path.basename(filename), media_type,
+                              h - (1 << 64) if h is not None and h >= 1 << 63 else h] + bands)
+
+    def get_hash_candidates(self, media_type: str, bands):
+        """
+            Returns [(filename, hash)] of active files sharing at least one band
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT h.filename, h.hash FROM hashes h JOIN media m ON m.filename = h.filename "
+                                    "WHERE (h.band0 = ? OR h.band1 = ? OR h.band2 = ? OR h.band3 = ?) "
+                                    "AND h.media_type = ? AND m.status = ?",
+                                    list(bands) + [media_type, MediaStatus.ACTIVE.value]).fetchall()
+        return [(f, h & ((1 << 64) - 1)) for f, h in rows]
+
+    def set_status(self, filename: str, status: MediaStatus):
+        with self._lock, self._db:
+            self._db.execute("UPDATE media SET status = ? WHERE filename = ?", (status.value, path.basename(filename)))
+
+    def get_state(self, key: str):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key: str, value: str):
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
@@ -0,0 +1,83 @@
+from datetime import datetime as dt
+from os import path
+from typing import NamedTuple
+from PIL import Image
+from src.logger import Logger
+import src.helper as hlpr
+
+EXIF_DATE_TIME_ORIGINAL = 36867
+MEDIA_TYPE_IMAGE = "image"
+MEDIA_TYPE_VIDEO = "video"
+
+logger = Logger("MediaMetadata")
+
+
+class MediaMetadata(NamedTuple):
+    media_type: str
+    width: int = 0  # once oriented
+    height: int = 0
+    orientation: int = 1
+    capture_ms: int = None
+    duration_s: float = 0
+    fps: float = 0
+    decode_ok: bool = False
+
+
+def _get_capture_ms(pil_image):
+    try:
+        exif = pil_image._getexif()
+        if exif and EXIF_DATE_TIME_ORIGINAL in exif:
+            return int(dt.strptime(exif[EXIF_DATE_TIME_ORIGINAL], "%Y:%m:%d %H:%M:%S").timestamp() * 1000)
+    except Exception:
+        # no exif or invalid date
+        pass
+    return None
+
+
+def _extract_image_metadata(file_path) -> MediaMetadata:
+    pil_image = Image.open(file_path)
+    orientation = hlpr.get_image_orientation(pil_image)
+    width, height = pil_image.size
+    if orientation in (5, 6, 7, 8):
+        width, height = height, width
+    capture_ms = _get_capture_ms(pil_image)
+    try:
+        # decode check, JPEG decoded at 1/8 scale
+        pil_image.draft(pil_image.mode, (max(1, pil_image.size[0] // 8), max(1, pil_image.size[1] // 8)))
+        pil_image.load()
+        decode_ok = True
+    except Exception:
+        decode_ok = False
+    return MediaMetadata(MEDIA_TYPE_IMAGE, width, height, orientation, capture_ms, decode_ok=decode_ok)
+
+
+def _extract_video_metadata(file_path) -> MediaMetadata:
+    import cv2
+    cap = cv2.VideoCapture(file_path)
+    try:
+        if not cap.isOpened():
+            return MediaMetadata(MEDIA_TYPE_VIDEO)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        nb_frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        ret, _ = cap.read()
+        duration_s = nb_frames / fps if fps > 0 and nb_frames > 0 else 0
+        return MediaMetadata(MEDIA_TYPE_VIDEO, width, height, 1, None, duration_s, fps, bool(ret) and fps > 0)
+    finally:
+        cap.release()
+
+
+def extract_metadata(file_path) -> MediaMetadata:
+    """
+        Reads metadata of a photo/video once, when it is downloaded
+        Returns None if file isn't a photo or a video
+    """
+    try:
+        if hlpr.is_valid_image_file(file_path):
+            return _extract_image_metadata(file_path)
+        if hlpr.is_valid_video_file(file_path):
+            return _extract_video_metadata(file_path)
+    except Exception as e:
+        logger.error("extract_metadata", f"can't read[{path.basename(file_path)}]", e)
+        return MediaMetadata(MEDIA_TYPE_VIDEO if hlpr.is_valid_video_file(file_path) else MEDIA_TYPE_IMAGE)
+    return None
@@ -0,0 +1,170 @@
+import json
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime as dt
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import replace
+from threading import Lock, Thread
+from time import perf_counter
+from src.logger import Logger
+
+PREFIX = "photoframe_"
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+
+
+class Histogram:
+    """
+        Durations (ms) counted in fixed buckets
+    """
+
+    def __init__(self, buckets=BUCKETS_MS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def get_cumulative_counts(self):
+        total, cumulative = 0, []
+        for c in self.counts:
+            total += c
+            cumulative.append(total)
+        return cumulative
+
+    def get_quantile(self, q: float):
+        """
+            Returns upper bound of the bucket holding quantile q, None if empty or above last bucket
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        for i, cumulative in enumerate(self.get_cumulative_counts()):
+            if cumulative >= rank:
+                return self.buckets[i] if i < len(self.buckets) else None
+        return None
+
+
+class Metrics:
+    """
+        Counters, gauges and duration histograms of the hot paths
+
+        Thread safe: updated from Tk main thread, prefetch and sync workers.
+        Exposed in Prometheus text format on a local endpoint and dumped as JSON.
+    """
+
+    def __init__(self) -> None:
+        self.logger = Logger(self.__class__.__name__)
+        self._lock = Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._server = None
+
+    def increment(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, duration_ms: float):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(duration_ms)
+
+    @contextmanager
+    def span(self, name: str):
+        """
+            Adds duration of the with block to histogram name
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (perf_counter() - start) * 1000)
+
+    def get_snapshot(self) -> dict:
+        with self._lock:
+            histograms = {}
+            for name, h in self._histograms.items():
+                histograms[name] = {
+                    "count": h.count,
+                    "sum_ms": round(h.sum, 3),
+                    "p50_ms": h.get_quantile(0.5),
+                    "p90_ms": h.get_quantile(0.9),
+                    "p99_ms": h.get_quantile(0.99),
+                    "buckets": dict(zip([str(b) for b in h.buckets] + ["+Inf"], h.get_cumulative_counts())),
+                }
+            return {
+                "date": dt.now().isoformat(timespec="seconds"),
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "histograms": histograms,
+            }
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name, value in sorted(self._counters.items()):
+                lines += [f"# TYPE {PREFIX}{name}_total counter", f"{PREFIX}{name}_total {value}"]
+            for name, value in sorted(self._gauges.items()):
+                lines += [f"# TYPE {PREFIX}{name} gauge", f"{PREFIX}{name} {value}"]
+            for name, h in sorted(self._histograms.items()):
+                metric = f"{PREFIX}{name}_ms"
+                lines.append(f"# TYPE {metric} histogram")
+                for le, cumulative in zip([str(b) for b in h.buckets] + ["+Inf"], h.get_cumulative_counts()):
+                    lines.append(f'{metric}_bucket{{le="{le}"}} {cumulative}')
+                lines += [f"{metric}_sum {h.sum:.3f}", f"{metric}_count {h.count}"]
+        return "\n".join(lines) + "\n"
+
+    def dump(self, file_path: str):
+        """
+            Writes snapshot as JSON, file is replaced at once
+        """
+        tmp = file_path + ".tmp"
+        with open(tmp, "w", encoding="UTF-8") as f:
+            json.dump(self.get_snapshot(), f, indent=2)
+        replace(tmp, file_path)
+
+    def start_server(self, port: int, host: str = "127.0.0.1"):
+        """
+            Serves /metrics in Prometheus text format, on localhost only by default
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode("UTF-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+        self.logger.info("start_server", f"metrics on http://{host}:{port}/metrics")
+
+    def stop_server(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+# shared by all modules
+metrics = Metrics()
@@ -0,0 +1,42 @@
+from queue import Queue
+from threading import Event, Thread
+from src.logger import Logger
+
+
+class PeriodicWorker(Thread):
+    """
+        Runs task on its own thread every interval_s seconds
+
+        Results are put in results queue as (name, result), to be read by the
+        Tk main loop: the task never touches Tk widgets
+    """
+
+    def __init__(self, name: str, task, interval_s: float, results: Queue) -> None:
+        super().__init__(name=name, daemon=True)
+        self.logger = Logger(self.__class__.__name__)
+        self._task = task
+        self.interval_s = interval_s
+        self._results = results
+        self._stop_event = Event()
+        self._wake_event = Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                result = self._task()
+                if result is not None:
+                    self._results.put((self.name, result))
+            except Exception as e:
+                self.logger.error("run", f"[{self.name}] Exception", e)
+            self._wake_event.wait(self.interval_s)
+            self._wake_event.clear()
+
+    def trigger(self):
+        """
+            Runs task now, without waiting for the interval
+        """
+        self._wake_event.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
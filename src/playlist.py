@@ -0,0 +1,284 @@
+import random
+from collections import deque
+from enum import Enum
+from os import path
+from threading import Lock
+from time import time
+from src.logger import Logger
+
+DAY_MS = 1000 * 60 * 60 * 24
+
+
+class PlaylistOrder(Enum):
+    DATE = "date"  # most recent first
+    SHUFFLE = "shuffle"  # weighted random
+
+
+class PlaylistItems:
+    """
+        Snapshot of the playlist: files and their index, timestamp, show count
+        Built on sync worker thread, swapped at once on Tk main thread
+    """
+
+    def __init__(self, entries) -> None:
+        """
+            :param entries: [(file path, timestamp_ms, show_count)], most recent first
+        """
+        self.files = tuple(e[0] for e in entries)
+        self.index = {f: i for i, f in enumerate(self.files)}
+        self.timestamps_ms = [e[1] for e in entries]
+        self.show_counts = [e[2] for e in entries]
+        self.max_weight = 1.0  # upper bound of shuffle weights
+
+    def __len__(self):
+        return len(self.files)
+
+
+class Playlist:
+    """
+        Slideshow order over the whole catalog, next/previous in O(1)
+
+        Files shown or drawn ahead are kept in a history with a cursor, so previous
+        slides are found again without searching the playlist. Drawing ahead lets
+        the prefetcher know the next slides in shuffle order too.
+
+        Shuffle draws by rejection sampling, weight favours recent and rarely shown
+        files, files drawn in the last no_repeat_window draws are rejected.
+    """
+    HISTORY_SIZE = 1000
+    RECENCY_HALF_LIFE_DAYS = 90
+    RECENCY_FLOOR = 0.1  # weight of very old files, still shown
+    MAX_DRAW_ATTEMPTS = 1000
+    STATE_POSITION = "playlist_position"
+
+    def __init__(self, catalog, order: PlaylistOrder = PlaylistOrder.DATE, no_repeat_window: int = 200,
+                 items: PlaylistItems = None) -> None:
+        """
+            :param items: playlist if already built, read from catalog if None
+        """
+        self.logger = Logger(self.__class__.__name__)
+        self.catalog = catalog
+        self.order = order
+        self.no_repeat_window = no_repeat_window
+        self._lock = Lock()
+        self._items = PlaylistItems([])
+        self._history = []
+        self._cursor = -1
+        self._recent = {}  # file: number of times in _recent_order
+        self._recent_order = deque()
+        self._pending_shown = []
+        self.update(items if items is not None else self.build_items(catalog))
+        self.restore_position()
+
+    def restore_position(self):
+        """
+            Next slide is the one current when position was saved
+        """
+        position = self.catalog.get_state(self.STATE_POSITION)
+        if position:
+            folder = path.dirname(self._items.files[0]) if self._items.files else ""
+            restored = path.join(folder, position)
+            if restored in self._items.index:
+                # next() shows it again
+                self._history = [restored]
+                self._cursor = -1
+                self.logger.info("restore_position", f"position restored[{position}]")
+
+    @classmethod
+    def get_weight(cls, timestamp_ms: int, show_count: int, now_ms: float) -> float:
+        age_days = max(0, now_ms - timestamp_ms) / DAY_MS
+        recency = cls.RECENCY_FLOOR + (1 - cls.RECENCY_FLOOR) * 0.5 ** (age_days / cls.RECENCY_HALF_LIFE_DAYS)
+        return recency / (1 + show_count)
+
+    @classmethod
+    def build_items(cls, catalog) -> PlaylistItems:
+        """
+            Reads playlist from catalog, O(n): called on sync worker thread
+        """
+        items = PlaylistItems(catalog.get_playlist_entries())
+        now_ms = time() * 1000
+        # weights only decrease afterwards (age, show count), max stays an upper bound
+        items.max_weight = max(map(lambda ts, c: cls.get_weight(ts, c, now_ms), items.timestamps_ms,
+                                   items.show_counts), default=1.0)
+        return items
+
+    def __len__(self):
+        return len(self._items)
+
+    def __get_window(self) -> int:
+        return min(self.no_repeat_window, len(self._items) // 2)
+
+    def __add_recent(self, file):
+        self._recent[file] = self._recent.get(file, 0) + 1
+        self._recent_order.append(file)
+        window = self.__get_window()
+        while len(self._recent_order) > window:
+            old = self._recent_order.popleft()
+            self._recent[old] -= 1
+            if self._recent[old] == 0:
+                del self._recent[old]
+
+    def __draw_shuffle(self):
+        items = self._items
+        now_ms = time() * 1000
+        n = len(items)
+        for _ in range(self.MAX_DRAW_ATTEMPTS):
+            i = random.randrange(n)
+            f = items.files[i]
+            if f in self._recent:
+                continue
+            if random.random() * items.max_weight <= self.get_weight(items.timestamps_ms[i], items.show_counts[i],
+                                                                     now_ms):
+                return f
+        # weights too low: uniform draw outside the window
+        for _ in range(self.MAX_DRAW_ATTEMPTS):
+            f = items.files[random.randrange(n)]
+            if f not in self._recent:
+                return f
+        return items.files[random.randrange(n)]
+
+    def __draw_after(self, file):
+        """
+            Returns file shown after file
+        """
+        items = self._items
+        if self.order == PlaylistOrder.SHUFFLE and len(items) > 1:
+            f = self.__draw_shuffle()
+        else:
+            i = items.index.get(file, -1)
+            f = items.files[(i + 1) % len(items)]
+        self.__add_recent(f)
+        return f
+
+    def __trim_history(self):
+        overflow = len(self._history) - self.HISTORY_SIZE
+        if overflow > 0 and self._cursor > overflow:
+            del self._history[:overflow]
+            self._cursor -= overflow
+
+    def current(self):
+        if 0 <= self._cursor < len(self._history):
+            return self._history[self._cursor]
+        return None
+
+    def get_window(self, size: int):
+        """
+            Returns files of history around current one, without drawing
+            Can run on a worker thread
+        """
+        history, cursor = self._history, self._cursor
+        return history[max(0, cursor - size):max(0, cursor + size + 1)]
+
+    def start_at(self, file):
+        """
+            Makes file the current one, playlist goes on after it once loaded (first slide at startup)
+        """
+        self._history = [file]
+        self._cursor = 0
+
+    def peek_next(self, count: int = 1):
+        """
+            Returns next count files, drawn ahead if needed
+        """
+        if not self._items.files:
+            return []
+        while len(self._history) - 1 - self._cursor < count:
+            last = self._history[-1] if self._history else None
+            self._history.append(self.__draw_after(last))
+        return self._history[self._cursor + 1:self._cursor + 1 + count]
+
+    def peek_previous(self):
+        if self._cursor > 0:
+            return self._history[self._cursor - 1]
+        current = self.current()
+        if current and self.order == PlaylistOrder.DATE and self._items.files:
+            i = self._items.index.get(current, 0)
+            return self._items.files[(i - 1) % len(self._items)]
+        return None
+
+    def next(self):
+        if not self._items.files:
+            return None
+        self.peek_next(1)
+        self._cursor += 1
+        self.__trim_history()
+        return self.current()
+
+    def previous(self):
+        if not self._items.files:
+            return None
+        if self._cursor > 0:
+            self._cursor -= 1
+            return self.current()
+        previous = self.peek_previous()
+        if previous is None:
+            # shuffle, nothing before history: new draw
+            previous = self.__draw_after(None)
+        self._history.insert(0, previous)
+        self._cursor = 0
+        if len(self._history) > self.HISTORY_SIZE:
+            del self._history[self.HISTORY_SIZE:]
+        return self.current()
+
+    def restart(self):
+        """
+            Goes to the most recent file, files drawn ahead are dropped
+        """
+        if not self._items.files:
+            return None
+        del self._history[self._cursor + 1:]
+        self._history.append(self._items.files[0])
+        self._cursor += 1
+        self.__trim_history()
+        return self.current()
+
+    def on_shown(self, file):
+        """
+            Counts file as shown, saved in catalog by save()
+        """
+        i = self._items.index.get(file)
+        if i is not None:
+            self._items.show_counts[i] += 1
+        with self._lock:
+            self._pending_shown.append((path.basename(file), int(time() * 1000)))
+
+    def update(self, items: PlaylistItems):
+        """
+            Replaces playlist, history keeps files still in playlist
+        """
+        with self._lock:
+            pending = [p for p, _ in self._pending_shown]
+        if pending and items.files:
+            folder = path.dirname(items.files[0])
+            for filename in pending:
+                i = items.index.get(path.join(folder, filename))
+                if i is not None:
+                    # not saved in catalog yet
+                    items.show_counts[i] += 1
+        current = self.current()
+        self._items = items
+        before = self._history[:self._cursor + 1]
+        kept_before = [f for f in before if f in items.index]
+        # files drawn ahead are drawn again
+        self._history = kept_before
+        self._cursor = len(kept_before) - 1
+        if current is not None and current not in items.index:
+            self.logger.info("update", f"current file removed[{path.basename(current)}]")
+        self._recent = {}
+        self._recent_order = deque()
+        window = self.__get_window()
+        if window > 0:
+            for f in kept_before[-window:]:
+                self.__add_recent(f)
+
+    def save(self):
+        """
+            Saves show counts and position in catalog, can run on a worker thread
+        """
+        with self._lock:
+            shown, self._pending_shown = self._pending_shown, []
+        if shown:
+            self.catalog.add_shown(shown)
+        current = self.current()
+        if current:
+            self.catalog.set_state(self.STATE_POSITION, path.basename(current))
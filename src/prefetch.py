@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from src.logger import Logger
+
+
+class Prefetcher:
+    """
+        Decodes, orients and scales upcoming slides on worker threads,
+        the Tk main thread only takes an image ready to be displayed
+    """
+
+    def __init__(self, loader, depth: int, max_bytes: int, slot_bytes: int, workers: int = 2) -> None:
+        """
+            :param loader: function(file_path) returning PIL image fitted to screen
+            :param depth: number of next slides decoded in advance
+            :param max_bytes: memory allowed for decoded slides
+            :param slot_bytes: max size in bytes of one decoded slide (screen size)
+            :param workers: number of decoding threads
+        """
+        self.logger = Logger(self.__class__.__name__)
+        self._loader = loader
+        self.depth = max(0, depth)
+        self.max_items = max(1, max_bytes // max(1, slot_bytes))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="prefetch")
+        self._lock = Lock()
+        self._futures = {}
+
+    def __load(self, file_path):
+        try:
+            return self._loader(file_path)
+        except Exception as e:
+            self.logger.error("__load", f"error decoding[{file_path}]", e)
+        return None
+
+    def schedule(self, next_files, previous_file=None):
+        """
+            :param next_files: next slides, in display order
+            :param previous_file: previous slide, kept ready for PREVIOUS_IMAGE
+
+            Starts decoding of wanted files and drops the others
+        """
+        wanted = []
+        for f in next_files[:self.depth]:
+            if f and f not in wanted:
+                wanted.append(f)
+        if previous_file and previous_file not in wanted:
+            wanted.append(previous_file)
+        wanted = wanted[:self.max_items]
+
+        with self._lock:
+            for f in list(self._futures.keys()):
+                if f not in wanted:
+                    self._futures.pop(f).cancel()
+            for f in wanted:
+                if f not in self._futures:
+                    self._futures[f] = self._executor.submit(self.__load, f)
+
+    def take(self, file_path):
+        """
+            Returns prefetched image or None if decoding hasn't started yet
+            Waits for the result if decoding is in progress
+        """
+        with self._lock:
+            future = self._futures.pop(file_path, None)
+        if future is None or future.cancel():
+            return None
+        return future.result()
+
+    def clear(self):
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+            self._futures.clear()
+
+    def shutdown(self):
+        self.clear()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,146 @@
+from contextlib import contextmanager
+from time import monotonic
+
+
+class PresentationClock:
+    """
+        Schedules slides and video frames on time.monotonic() deadlines
+
+        Render costs are measured (exponential moving average) so callbacks are
+        scheduled ahead of their deadline, and video frames are dropped when
+        rendering can't keep up with the video frame rate.
+        Transition frames are spaced by their render cost when it exceeds the target fps.
+    """
+    PHOTO = "photo"
+    VIDEO_FRAME = "video_frame"
+    TRANSITION_FRAME = "transition_frame"
+
+    def __init__(self, slide_interval_ms: int, smoothing: float = 0.2) -> None:
+        self.slide_interval_s = slide_interval_ms / 1000
+        self.smoothing = smoothing
+        self._costs = {self.PHOTO: 0.0, self.VIDEO_FRAME: 0.0, self.TRANSITION_FRAME: 0.0}
+        self._slide_deadline = None
+        self._video_start = None
+        self._video_fps = 0
+        self._video_index = -1
+        self.dropped_frames = 0
+        self._transition_start = None
+        self._transition_duration_s = 0
+        self._transition_interval_s = 0
+
+    def add_render_cost(self, kind: str, seconds: float):
+        if seconds >= 0:
+            self._costs[kind] += self.smoothing * (seconds - self._costs[kind])
+
+    @contextmanager
+    def measure(self, kind: str):
+        start = monotonic()
+        try:
+            yield
+        finally:
+            self.add_render_cost(kind, monotonic() - start)
+
+    def __get_delay_ms(self, deadline, kind):
+        return max(0, int((deadline - monotonic() - self._costs[kind]) * 1000))
+
+    # region Photo
+
+    def start_slide(self, on_time: bool):
+        """
+            :param on_time: True if slide was shown by the slideshow timer,
+                False if shown by an user action (or after a video)
+
+            Next deadline follows the previous one, so decode time doesn't make the slideshow drift
+        """
+        now = monotonic()
+        if on_time and self._slide_deadline is not None and now - self._slide_deadline < self.slide_interval_s:
+            self._slide_deadline += self.slide_interval_s
+        else:
+            self._slide_deadline = now + self.slide_interval_s
+
+    def get_slide_delay_ms(self) -> int:
+        """
+            Returns delay before showing next slide, rendered cost included
+        """
+        if self._slide_deadline is None:
+            return int(self.slide_interval_s * 1000)
+        return self.__get_delay_ms(self._slide_deadline, self.PHOTO)
+
+    # endregion
+
+    # region Video
+
+    def start_video(self, fps: float):
+        self._video_start = monotonic()
+        self._video_fps = fps
+        self._video_index = -1
+        self.dropped_frames = 0
+
+    def get_video_elapsed_ms(self) -> int:
+        if self._video_start is None:
+            return 0
+        return int((monotonic() - self._video_start) * 1000)
+
+    def get_video_frames_due(self) -> int:
+        """
+            Returns number of frames to move forward to present the frame due now
+            0 if the next frame isn't due yet, > 1 if frames must be dropped
+        """
+        if self._video_start is None or self._video_fps <= 0:
+            return 0
+        elapsed = monotonic() - self._video_start + self._costs[self.VIDEO_FRAME]
+        return max(0, int(elapsed * self._video_fps) - self._video_index)
+
+    def on_video_frames_presented(self, nb_frames: int):
+        """
+            :param nb_frames: frames moved forward, only the last one was presented
+        """
+        self._video_index += nb_frames
+        self.dropped_frames += max(0, nb_frames - 1)
+
+    def get_video_frame_delay_ms(self) -> int:
+        if self._video_start is None or self._video_fps <= 0:
+            return 0
+        deadline = self._video_start + (self._video_index + 1) / self._video_fps
+        return self.__get_delay_ms(deadline, self.VIDEO_FRAME)
+
+    def stop_video(self):
+        self._video_start = None
+        self._video_fps = 0
+
+    # endregion
+
+    # region Transition
+
+    def is_transition_possible(self, duration_ms: int, min_steps: int) -> bool:
+        """
+            False if min_steps frames can't be rendered within duration_ms
+        """
+        return self._costs[self.TRANSITION_FRAME] * min_steps * 1000 <= duration_ms
+
+    def start_transition(self, duration_ms: int, fps: float):
+        self._transition_start = monotonic()
+        self._transition_duration_s = duration_ms / 1000
+        self._transition_interval_s = 1 / fps
+
+    def get_transition_progress(self) -> float:
+        """
+            Returns progress (0 to 1) of the frame rendered now, at the time it will be presented
+        """
+        if self._transition_start is None or self._transition_duration_s <= 0:
+            return 1.0
+        elapsed = monotonic() - self._transition_start + self._costs[self.TRANSITION_FRAME]
+        return min(1.0, elapsed / self._transition_duration_s)
+
+    def get_transition_frame_delay_ms(self) -> int:
+        """
+            Frames over budget: next frame spaced by render cost, transition has fewer steps
+        """
+        cost = self._costs[self.TRANSITION_FRAME]
+        interval = max(self._transition_interval_s, cost * 2)
+        return max(1, int((interval - cost) * 1000))
+
+    def stop_transition(self):
+        self._transition_start = None
+
+    # endregion
@@ -0,0 +1,161 @@
+from os import listdir, path, remove, replace, stat, utime
+from threading import Lock
+from time import time
+from PIL import Image
+from src.logger import Logger
+from src.metrics import metrics
+import src.helper as hlpr
+
+
+def save_rendition(pil_image, file_path, quality: int):
+    """
+        Saves image as JPEG, transparency on black, file is replaced at once
+    """
+    if pil_image.mode != "RGB":
+        background = Image.new("RGB", pil_image.size, "black")
+        if "A" in pil_image.getbands() or "transparency" in pil_image.info:
+            rgba = pil_image.convert("RGBA")
+            background.paste(rgba, mask=rgba.getchannel("A"))
+        else:
+            background.paste(pil_image.convert("RGB"))
+        pil_image = background
+    tmp = file_path + ".tmp"
+    pil_image.save(tmp, "JPEG", quality=quality)
+    replace(tmp, file_path)
+
+
+class RenditionCache:
+    """
+        On disk cache of photos already oriented and fitted to the screen
+
+        Renditions are stored in cache/renditions/<width>x<height>/, keyed by
+        source path, size and modification time. Least recently used renditions
+        are removed when the cache exceeds max_bytes.
+    """
+    JPEG_QUALITY = 92
+
+    def __init__(self, project_path: str, width: int, height: int, max_bytes: int, load_index: bool = True) -> None:
+        """
+            :param load_index: False to call load_index() later (after the first slide), renditions are
+                then looked up on disk
+        """
+        self.logger = Logger(self.__class__.__name__)
+        self.width, self.height = width, height
+        self.max_bytes = max_bytes
+        self.folder = hlpr.get_path_cache(project_path, "renditions", width, height)
+        self._lock = Lock()
+        self._entries = {}  # rendition filename -> [size, last access]
+        self._total_bytes = 0
+        self._index_loaded = False
+        if load_index:
+            self.load_index()
+
+    def load_index(self):
+        """
+            Reads renditions on disk, renditions stored before are kept
+        """
+        entries = {}
+        for f in listdir(self.folder):
+            p = path.join(self.folder, f)
+            if f.endswith(".tmp"):
+                remove(p)
+                continue
+            st = stat(p)
+            entries[f] = [st.st_size, st.st_mtime]
+        with self._lock:
+            for f, entry in entries.items():
+                if f not in self._entries:
+                    self._entries[f] = entry
+                    self._total_bytes += entry[0]
+            self._index_loaded = True
+            self.__evict()
+        self.logger.info("load_index", f"{len(self._entries)} rendition(s), {self._total_bytes} bytes")
+
+    def __get_key(self, file_path) -> str:
+        return hlpr.get_file_key(file_path) + ".jpg"
+
+    def __evict(self):
+        """
+            Removes least recently used renditions, lock must be held
+        """
+        if self._total_bytes <= self.max_bytes:
+            return
+        for f, (size, _) in sorted(self._entries.items(), key=lambda x: x[1][1]):
+            try:
+                remove(path.join(self.folder, f))
+            except FileNotFoundError:
+                pass
+            del self._entries[f]
+            self._total_bytes -= size
+            if self._total_bytes <= self.max_bytes:
+                break
+
+    def get(self, file_path):
+        """
+            Returns rendition of file_path, None if not cached or if file_path was removed
+        """
+        try:
+            key = self.__get_key(file_path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._index_loaded:
+                return None
+            if entry is not None:
+                entry[1] = time()
+        p = path.join(self.folder, key)
+        try:
+            pil_image = Image.open(p)
+            pil_image.load()
+            utime(p)
+            return pil_image
+        except FileNotFoundError:
+            # index not loaded yet
+            if entry is None:
+                return None
+            self.logger.warning("get", f"missing rendition[{key}]")
+        except Exception as e:
+            self.logger.warning("get", f"unreadable rendition[{key}]", e)
+        if entry is not None:
+            with self._lock:
+                if self._entries.pop(key, None):
+                    self._total_bytes -= entry[0]
+        return None
+
+    def get_rendition_path(self, file_path) -> str:
+        return path.join(self.folder, self.__get_key(file_path))
+
+    def put(self, file_path, pil_image):
+        save_rendition(pil_image, self.get_rendition_path(file_path), self.JPEG_QUALITY)
+        self.register(file_path)
+
+    def register(self, file_path):
+        """
+            Adds rendition of file_path written by another process (see save_rendition) to the index
+        """
+        key = self.__get_key(file_path)
+        p = path.join(self.folder, key)
+        size = stat(p).st_size
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous:
+                self._total_bytes -= previous[0]
+            self._entries[key] = [size, time()]
+            self._total_bytes += size
+            self.__evict()
+
+    def load(self, file_path, orientation=None):
+        """
+            Returns rendition of file_path, creates it from the original if needed
+            :param orientation: EXIF orientation if already known
+        """
+        pil_image = self.get(file_path)
+        metrics.increment("rendition_cache_misses" if pil_image is None else "rendition_cache_hits")
+        if pil_image is None:
+            pil_image = hlpr.load_image_to_fit(file_path, self.width, self.height, orientation)
+            try:
+                self.put(file_path, pil_image)
+            except Exception as e:
+                self.logger.error("load", f"can't store rendition[{path.basename(file_path)}]", e)
+        return pil_image
@@ -0,0 +1,86 @@
+from os import path, remove, scandir
+from time import time
+from src.logger import Logger
+from src.media_catalog import MediaCatalog, MediaStatus
+from src.metrics import metrics
+import src.helper as hlpr
+
+DAY_MS = 1000 * 60 * 60 * 24
+
+
+class StorageManager:
+    """
+        Keeps attachments folder under a byte budget
+
+        Once the folder exceeds high_watermark of max_bytes, files are removed until
+        it is under low_watermark. Old and often shown files go first, pinned files
+        (slides around the current one) are kept. Removed files stay in catalog
+        with EVICTED status, so downloaders don't fetch them again.
+    """
+
+    def __init__(self, project_path: str, catalog: MediaCatalog, max_bytes: int, high_watermark: float = 0.9,
+                 low_watermark: float = 0.75) -> None:
+        self.logger = Logger(self.__class__.__name__)
+        self.folder = hlpr.get_path_attachments(project_path)
+        self.catalog = catalog
+        self.max_bytes = max_bytes
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+
+    def get_used_bytes(self) -> int:
+        total = 0
+        with scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    total += entry.stat().st_size
+        return total
+
+    def __get_eviction_order(self, pinned):
+        """
+            Returns filenames of files on disk, first to evict first
+        """
+        now_ms = time() * 1000
+        candidates = []
+        for filename, timestamp_ms, show_count, status in self.catalog.get_eviction_candidates():
+            if filename in pinned:
+                continue
+            if status == MediaStatus.DUPLICATE:
+                # not shown anyway
+                candidates.append((float("inf"), filename))
+                continue
+            age_days = max(0, now_ms - timestamp_ms) / DAY_MS
+            candidates.append((age_days * (1 + show_count), filename))
+        candidates.sort(reverse=True)
+        return [filename for _, filename in candidates]
+
+    def run(self, pinned_files=()) -> int:
+        """
+            :param pinned_files: files never evicted
+            Returns bytes reclaimed
+        """
+        used_bytes = self.get_used_bytes()
+        if used_bytes <= self.max_bytes * self.high_watermark:
+            return 0
+        target_bytes = self.max_bytes * self.low_watermark
+        pinned = {path.basename(f) for f in pinned_files if f}
+        reclaimed_bytes, evicted = 0, 0
+        for filename in self.__get_eviction_order(pinned):
+            if used_bytes - reclaimed_bytes <= target_bytes:
+                break
+            p = path.join(self.folder, filename)
+            try:
+                size = path.getsize(p)
+                remove(p)
+            except FileNotFoundError:
+                size = 0
+            except Exception as e:
+                self.logger.error("run", f"can't remove[{filename}]", e)
+                continue
+            self.catalog.set_status(filename, MediaStatus.EVICTED)
+            reclaimed_bytes += size
+            evicted += 1
+        metrics.increment("storage_evicted_files", evicted)
+        metrics.increment("storage_reclaimed_bytes", reclaimed_bytes)
+        self.logger.info("run", f"{evicted} file(s) evicted, {reclaimed_bytes} bytes reclaimed, "
+                                f"{used_bytes - reclaimed_bytes} / {self.max_bytes} bytes used")
+        return reclaimed_bytes
@@ -0,0 +1,41 @@
+import numpy as np
+from PIL import Image
+
+
+class Crossfade:
+    """
+        Blends outgoing and incoming slides of screen size
+
+        Buffers are allocated once, images are letterboxed (centered on black)
+        like the label displays them, each frame is blended in place with cv2.addWeighted
+    """
+
+    def __init__(self, width: int, height: int) -> None:
+        self.width, self.height = width, height
+        self._from = np.zeros((height, width, 3), dtype=np.uint8)
+        self._to = np.zeros((height, width, 3), dtype=np.uint8)
+        self._out = np.zeros((height, width, 3), dtype=np.uint8)
+
+    def __letterbox(self, pil_image: Image, buffer):
+        if pil_image.mode != "RGB":
+            pil_image = pil_image.convert("RGB")
+        array = np.asarray(pil_image)
+        h, w = min(array.shape[0], self.height), min(array.shape[1], self.width)
+        y, x = (self.height - h) // 2, (self.width - w) // 2
+        buffer.fill(0)
+        buffer[y:y + h, x:x + w] = array[:h, :w]
+
+    def start(self, from_frame, to_image: Image):
+        """
+            :param from_frame: frame displayed (height, width, 3)
+            :param to_image: image fitted to screen
+        """
+        np.copyto(self._from, from_frame)
+        self.__letterbox(to_image, self._to)
+
+    def blend(self, progress: float):
+        """
+            Returns frame at progress (0: outgoing slide, 1: incoming slide), buffer reused by next call
+        """
+        import cv2
+        return cv2.addWeighted(self._from, 1 - progress, self._to, progress, 0, dst=self._out)
@@ -0,0 +1,223 @@
+import json
+from os import listdir, path, remove, replace, stat, utime
+from queue import Empty, Queue
+from threading import Lock, Thread
+from time import time
+import numpy as np
+from src.logger import Logger
+import src.helper as hlpr
+
+
+class CachedVideo:
+    """
+        Frames of a video read lazily from a memory-mapped file
+    """
+
+    def __init__(self, frames_path: str, count: int, height: int, width: int, fps: float) -> None:
+        self.frames = np.memmap(frames_path, dtype=np.uint8, mode="r", shape=(count, height, width, 3))
+        self.fps = fps
+
+    def __len__(self):
+        return self.frames.shape[0]
+
+    def close(self):
+        self.frames = None
+
+
+class VideoCacheWriter:
+    """
+        Appends decoded frames to a temporary file, visible in cache after commit()
+
+        Frames are copied into a small pool of buffers and written by a writer thread,
+        the decoder never waits for the disk. Caching is abandoned when the disk falls
+        behind (no free buffer) or when the video exceeds max_video_bytes.
+    """
+    QUEUE_SIZE = 8  # frames waiting to be written
+
+    def __init__(self, cache, key: str, height: int, width: int, fps: float) -> None:
+        self._cache = cache
+        self.key = key
+        self.height, self.width, self.fps = height, width, fps
+        self.count = 0
+        self._tmp_path = path.join(cache.folder, key + ".frames.tmp")
+        self._file = open(self._tmp_path, "wb")
+        self._buffers = np.empty((self.QUEUE_SIZE, height, width, 3), dtype=np.uint8)
+        self._free = Queue()
+        for i in range(self.QUEUE_SIZE):
+            self._free.put(i)
+        self._pending = Queue()
+        self._aborted = False
+        self._closed = False
+        self._thread = Thread(target=self.__write, name="video_cache_writer", daemon=True)
+        self._thread.start()
+
+    def __write(self):
+        try:
+            while True:
+                i = self._pending.get()
+                if i is None:
+                    break
+                if not self._aborted:
+                    self._file.write(memoryview(self._buffers[i]))
+                self._free.put(i)
+            self._file.close()
+            if not self._aborted and self.count > 0:
+                self._cache.add(self)
+            else:
+                remove(self._tmp_path)
+        except Exception as e:
+            self._cache.logger.error("__write", f"can't cache video[{self.key}]", e)
+            try:
+                self._file.close()
+                remove(self._tmp_path)
+            except Exception:
+                pass
+        finally:
+            self._buffers = None
+
+    def append(self, frame) -> bool:
+        """
+            Returns False if video isn't cached (aborted), next frames are ignored
+        """
+        if self._closed:
+            return False
+        if self._cache.max_video_bytes < (self.count + 1) * frame.nbytes:
+            self._cache.logger.info("append", f"video[{self.key}] too large for cache")
+            self.abort()
+            return False
+        try:
+            i = self._free.get_nowait()
+        except Empty:
+            self._cache.logger.info("append", f"disk too slow, video[{self.key}] not cached")
+            self.abort()
+            return False
+        np.copyto(self._buffers[i], frame)
+        self._pending.put(i)
+        self.count += 1
+        return True
+
+    def commit(self):
+        """
+            Video added to cache once frames pending are written
+        """
+        if not self._closed:
+            self._closed = True
+            self._pending.put(None)
+
+    def abort(self):
+        if not self._closed:
+            self._aborted = True
+            self._closed = True
+            self._pending.put(None)
+
+
+class VideoFrameCache:
+    """
+        On disk cache of video frames fitted to the screen, stored as raw uint8
+        arrays (cache/videos/<width>x<height>/<key>.frames + <key>.json)
+
+        Least recently played videos are removed to stay under max_bytes
+    """
+
+    def __init__(self, project_path: str, width: int, height: int, max_bytes: int, max_video_bytes: int = None,
+                 load_index: bool = True) -> None:
+        """
+            :param max_video_bytes: videos larger aren't cached, max_bytes / 4 if None
+            :param load_index: False to call load_index() later, before the first video
+        """
+        self.logger = Logger(self.__class__.__name__)
+        self.max_bytes = max_bytes
+        self.max_video_bytes = min(max_bytes, max_video_bytes or max_bytes // 4)
+        self.folder = hlpr.get_path_cache(project_path, "videos", width, height)
+        self._lock = Lock()
+        self._entries = {}  # key -> [size, last access]
+        self._total_bytes = 0
+        if load_index:
+            self.load_index()
+
+    def __get_paths(self, key):
+        return path.join(self.folder, key + ".frames"), path.join(self.folder, key + ".json")
+
+    def load_index(self):
+        entries = {}
+        for f in listdir(self.folder):
+            if f.endswith(".tmp"):
+                remove(path.join(self.folder, f))
+            elif f.endswith(".frames"):
+                key = f[:-len(".frames")]
+                frames_path, meta_path = self.__get_paths(key)
+                if not path.exists(meta_path):
+                    remove(frames_path)
+                    continue
+                st = stat(frames_path)
+                entries[key] = [st.st_size, st.st_mtime]
+        with self._lock:
+            for key, entry in entries.items():
+                if key not in self._entries:
+                    self._entries[key] = entry
+                    self._total_bytes += entry[0]
+        self.logger.info("load_index", f"{len(self._entries)} video(s), {self._total_bytes} bytes")
+
+    def __remove(self, key):
+        """
+            lock must be held
+        """
+        for p in self.__get_paths(key):
+            try:
+                remove(p)
+            except FileNotFoundError:
+                pass
+        size, _ = self._entries.pop(key)
+        self._total_bytes -= size
+
+    def __evict(self, needed_bytes):
+        """
+            Removes least recently played videos until needed_bytes fit, lock must be held
+        """
+        for key, _ in sorted(self._entries.items(), key=lambda x: x[1][1]):
+            if self._total_bytes + needed_bytes <= self.max_bytes:
+                break
+            self.__remove(key)
+
+    def get_key(self, file_path, max_fps) -> str:
+        return hlpr.get_file_key(file_path, max_fps)
+
+    def open(self, key):
+        """
+            Returns CachedVideo or None if not cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            entry[1] = time()
+        frames_path, meta_path = self.__get_paths(key)
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            cached = CachedVideo(frames_path, meta["count"], meta["height"], meta["width"], meta["fps"])
+            utime(frames_path)
+            return cached
+        except Exception as e:
+            self.logger.warning("open", f"invalid cached video[{key}]", e)
+            with self._lock:
+                if key in self._entries:
+                    self.__remove(key)
+        return None
+
+    def create_writer(self, key, height, width, fps) -> VideoCacheWriter:
+        return VideoCacheWriter(self, key, height, width, fps)
+
+    def add(self, writer: VideoCacheWriter):
+        frames_path, meta_path = self.__get_paths(writer.key)
+        size = stat(writer._tmp_path).st_size
+        with self._lock:
+            if writer.key in self._entries:
+                self.__remove(writer.key)
+            self.__evict(size)
+            with open(meta_path, "w") as f:
+                json.dump({"count": writer.count, "height": writer.height, "width": writer.width, "fps": writer.fps}, f)
+            replace(writer._tmp_path, frames_path)
+            self._entries[writer.key] = [size, time()]
+            self._total_bytes += size
+        self.logger.info("add", f"video cached[{writer.key}], {writer.count} frames, {size} bytes")
@@ -0,0 +1,214 @@
+from threading import Condition, Event, Thread
+import numpy as np
+from src.logger import Logger
+import src.helper as hlpr
+
+
+class VideoStream:
+    """
+        Decodes a video on a background thread into a fixed size ring buffer
+        of RGB frames already fitted to the screen
+
+        The video is looped by seeking back to the first frame, the decoder
+        and its buffer are released by close()
+        With a VideoFrameCache, the first pass is stored in cache and next plays
+        read frames from the memory-mapped cache without decoding
+    """
+
+    def __init__(self, file_path: str, width: int, height: int, buffer_size: int = 8, max_fps: float = None,
+                 cache=None, metadata=None) -> None:
+        """
+            :param width, height: screen size, frames are fitted into it
+            :param buffer_size: number of decoded frames kept ahead
+            :param max_fps: video is decimated to max_fps
+            :param cache: VideoFrameCache, optional
+            :param metadata: MediaMetadata of the video, optional. Video properties aren't read again
+        """
+        self.logger = Logger(self.__class__.__name__)
+        self.file_path = file_path
+        self.width, self.height = width, height
+        self.buffer_size = max(2, buffer_size)
+        self.max_fps = max_fps
+        self.fps = 0
+        self.error = None
+        self._ready = Event()
+        self._stop = Event()
+        self._cond = Condition()
+        self._frames = None  # ring buffer, shape (buffer_size, h, w, 3)
+        self._passes = [0] * self.buffer_size
+        self._read_index, self._write_index, self._count = 0, 0, 0
+        self._holding = False  # reader holds the slot at _read_index
+        self._pending_skip = 0  # frames to drop before decoding
+        self._cache = cache
+        self._cache_key = None
+        self._cached = None  # CachedVideo when video is already in cache
+        if metadata is not None and metadata.fps > 0 and metadata.width > 0 and metadata.height > 0:
+            self._metadata = metadata
+        else:
+            self._metadata = None
+        self._thread = Thread(target=self.__decode, name="video_stream", daemon=True)
+
+    def start(self, timeout_s: float = 5):
+        """
+            Starts decoding, returns (error, fps) once the video is opened
+        """
+        if self._cache:
+            try:
+                self._cache_key = self._cache.get_key(self.file_path, self.max_fps)
+                self._cached = self._cache.open(self._cache_key)
+            except Exception as e:
+                self.logger.warning("start", "video cache unavailable", e)
+            if self._cached is not None and len(self._cached) > 0:
+                self.fps = self._cached.fps
+                return self.error, self.fps
+        self._thread.start()
+        if self._metadata is not None:
+            # no need to wait for the decoder
+            self.fps = hlpr.get_video_fps(self._metadata.fps, self.max_fps)
+            return self.error, self.fps
+        if not self._ready.wait(timeout_s):
+            self.error = "timeout opening video"
+        return self.error, self.fps
+
+    def __decode(self):
+        import cv2
+        cap, writer = None, None
+        try:
+            cap = cv2.VideoCapture(self.file_path)
+            if not cap.isOpened():
+                self.error = "not isOpened"
+                return
+            if self._metadata is not None:
+                src_fps, src_width, src_height = self._metadata.fps, self._metadata.width, self._metadata.height
+            else:
+                src_fps = cap.get(cv2.CAP_PROP_FPS)
+                src_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                src_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            self.fps = hlpr.get_video_fps(src_fps, self.max_fps)
+            if src_width <= 0 or src_height <= 0 or self.fps <= 0:
+                self.error = f"invalid video properties[{src_width}x{src_height}, {self.fps}fps]"
+                return
+            width, height = hlpr.get_size_to_fit(src_width, src_height, self.width, self.height)
+            # local reference: close() may drop self._frames while a frame is being decoded
+            frames = self._frames = np.empty((self.buffer_size, height, width, 3), dtype=np.uint8)
+            bgr = np.empty((height, width, 3), dtype=np.uint8)
+            if self._cache_key:
+                writer = self._cache.create_writer(self._cache_key, height, width, self.fps)
+            self._ready.set()
+
+            video_pass, i, frames_in_pass = 0, 0, 0
+            while not self._stop.is_set():
+                keep = hlpr.is_frame_kept(i, src_fps, self.max_fps)
+                if keep and writer is None and self._pending_skip > 0:
+                    # late, frame is dropped without being decoded
+                    with self._cond:
+                        self._pending_skip -= 1
+                    keep = False
+                if keep:
+                    ret, frame = cap.read()
+                else:
+                    ret = cap.grab()
+                if not ret:
+                    if frames_in_pass == 0:
+                        if video_pass == 0:
+                            self.error = "no frames"
+                        break
+                    if writer:
+                        writer.commit()
+                        writer = None
+                    # looping without re-opening the file
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    video_pass, i, frames_in_pass = video_pass + 1, 0, 0
+                    with self._cond:
+                        self._pending_skip = 0
+                    continue
+                i += 1
+                frames_in_pass += 1
+                if not keep:
+                    continue
+                with self._cond:
+                    while self._count >= self.buffer_size and not self._stop.is_set():
+                        self._cond.wait()
+                    if self._stop.is_set():
+                        break
+                    slot = self._write_index
+                cv2.resize(frame, (width, height), dst=bgr, interpolation=cv2.INTER_AREA)
+                cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=frames[slot])
+                if writer and not writer.append(frames[slot]):
+                    # not cached, late frames can be dropped again
+                    writer = None
+                with self._cond:
+                    self._passes[slot] = video_pass
+                    self._write_index = (slot + 1) % self.buffer_size
+                    self._count += 1
+                    self._cond.notify_all()
+        except Exception as e:
+            self.error = e
+            self.logger.error("__decode", f"error decoding[{self.file_path}]", e)
+        finally:
+            if writer:
+                # first pass not complete
+                writer.abort()
+                writer = None
+            if cap is not None:
+                cap.release()
+            self._ready.set()
+            with self._cond:
+                self._cond.notify_all()
+
+    def __release_slot(self):
+        """
+            lock must be held
+        """
+        self._read_index = (self._read_index + 1) % self.buffer_size
+        self._count -= 1
+        self._cond.notify_all()
+
+    def read(self, skip: int = 0):
+        """
+            :param skip: number of frames dropped before the returned one
+
+            Returns (frame, pass_index) or (None, -1) if no frame is decoded yet
+            Frame is a view on the ring buffer, valid until the next read()
+        """
+        if self._cached is not None:
+            self._read_index += skip
+            index = self._read_index % len(self._cached)
+            video_pass = self._read_index // len(self._cached)
+            self._read_index += 1
+            return self._cached.frames[index], video_pass
+        with self._cond:
+            if self._holding:
+                self.__release_slot()
+                self._holding = False
+            while skip > 0 and self._count > 1:
+                self.__release_slot()
+                skip -= 1
+            # frames not decoded yet are dropped by the decoder
+            self._pending_skip = max(self._pending_skip, skip)
+            if self._count == 0:
+                return None, -1
+            self._holding = True
+            return self._frames[self._read_index], self._passes[self._read_index]
+
+    def is_finished(self):
+        """
+            True if decoder stopped and every frame has been read
+        """
+        if self._cached is not None:
+            return False
+        with self._cond:
+            return not self._thread.is_alive() and self._count <= (1 if self._holding else 0)
+
+    def close(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread.is_alive():
+            self._thread.join(timeout=1)
+        if self._cached is not None:
+            self._cached.close()
+        self._cached = None
+        if not self._thread.is_alive():
+            # else decoder still blocked in cap.read(), buffer freed with the stream
+            self._frames = None
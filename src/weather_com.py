@@ -1,9 +1,70 @@
+from html.parser import HTMLParser
 import requests
-from bs4 import BeautifulSoup
 from src.logger import Logger
+from src.metrics import metrics
+
+
+class _SpanTextExtractor(HTMLParser):
+    """
+        Collects text of the first span whose class starts with each prefix
+    """
+
+    def __init__(self, class_prefixes) -> None:
+        super().__init__(convert_charrefs=True)
+        self._prefixes = list(class_prefixes)
+        self.values = {}
+        self._current = None
+        self._depth = 0
+        self._text = []
+
+    def is_complete(self) -> bool:
+        return len(self.values) == len(self._prefixes)
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "span":
+            return
+        if self._current is not None:
+            self._depth += 1
+            return
+        classes = dict(attrs).get("class") or ""
+        for prefix in self._prefixes:
+            if prefix not in self.values and any(c.startswith(prefix) for c in classes.split()):
+                self._current, self._depth, self._text = prefix, 0, []
+                break
+
+    def handle_endtag(self, tag):
+        if tag != "span" or self._current is None:
+            return
+        if self._depth > 0:
+            self._depth -= 1
+            return
+        self.values[self._current] = "".join(self._text)
+        self._current = None
+
+    def handle_data(self, data):
+        if self._current is not None:
+            self._text.append(data)
+
+
+def extract_spans_text(html: str, class_prefixes, chunk_size: int = 32 * 1024) -> dict:
+    """
+        Returns {class prefix: text} of spans found in html
+
+        Page is parsed by chunks, parsing stops once every span is found
+    """
+    extractor = _SpanTextExtractor(class_prefixes)
+    for i in range(0, len(html), chunk_size):
+        extractor.feed(html[i:i + chunk_size])
+        if extractor.is_complete():
+            break
+    return extractor.values
 
 
 class WeatherDotCom:
+    TEMP_CLASS_PREFIX = "CurrentConditions--tempValue"
+    FEELS_LIKE_CLASS_PREFIX = "TodayDetailsCard--feelsLikeTempValue"
+    REQUEST_TIMEOUT_S = (5, 15)  # connect, read
+
     def __init__(self, city_name: str) -> None:
         if not city_name:
             raise Exception(f"Invalid parameters[{city_name}]")
@@ -17,7 +78,8 @@ class WeatherDotCom:
 
     def __send_get_request(self, url):
         try:
-            res = requests.get(url)
+            with metrics.span("weather_request"):
+                res = requests.get(url, timeout=self.REQUEST_TIMEOUT_S)
             if res and res.status_code == 200:
                 return True, res.text
             else:
@@ -26,32 +88,15 @@ class WeatherDotCom:
             self.logger.error("__send_get_request", "Exception", e)
         return False, None
 
-    def __parse_feels_like_temp(self, soup: BeautifulSoup):
-        try:
-            res = soup.find("span", class_=lambda c: c and c.startswith("TodayDetailsCard--feelsLikeTempValue"))
-            if res and res.text and res.text.strip():
-                return res.text.strip()
-            else:
-                if res:
-                    self.logger.warning("__parse_feels_like_temp", f"can't find feels_like_temperature[{res.text}]")
-                else:
-                    self.logger.warning("__parse_feels_like_temp", f"can't find feels_like_temperature[!res]")
-        except Exception as e:
-            self.logger.error("__parse_feels_like_temp", f"Error parsing webpage", e)
-        return None
-
-    def __parse_temp(self, soup: BeautifulSoup):
-        try:
-            res = soup.find("span", class_=lambda c: c and c.startswith("CurrentConditions--tempValue"))
-            if res and res.text and res.text.strip():
-                return res.text.strip()
+    def __get_value(self, values: dict, name: str, prefix: str):
+        res = values.get(prefix)
+        if res and res.strip():
+            return res.strip()
+        else:
+            if res is not None:
+                self.logger.warning("get_temp_and_feels_temp", f"can't find {name}[{res}]")
             else:
-                if res:
-                    self.logger.warning("__parse_temp", f"can't find temperature[{res.text}]")
-                else:
-                    self.logger.warning("__parse_temp", f"can't find temperature[!res]")
-        except Exception as e:
-            self.logger.error("__parse_temp", f"Error parsing webpage", e)
+                self.logger.warning("get_temp_and_feels_temp", f"can't find {name}[!res]")
         return None
 
     def get_temp_and_feels_temp(self):
@@ -60,9 +105,10 @@ class WeatherDotCom:
         success, data = self.__send_get_request(url)
         if success and data:
             try:
-                soup = BeautifulSoup(data, "html.parser")
-                temp = self.__parse_temp(soup)
-                feels_temp = self.__parse_feels_like_temp(soup)
+                with metrics.span("weather_parse"):
+                    values = extract_spans_text(data, [self.TEMP_CLASS_PREFIX, self.FEELS_LIKE_CLASS_PREFIX])
+                temp = self.__get_value(values, "temperature", self.TEMP_CLASS_PREFIX)
+                feels_temp = self.__get_value(values, "feels_like_temperature", self.FEELS_LIKE_CLASS_PREFIX)
                 if temp is not None:
                     temp = temp.replace("°", "") + "°C"
                 if feels_temp is not None:
@@ -73,5 +119,6 @@ class WeatherDotCom:
                 self.logger.error("get_temp_and_feels_temp", f"Error parsing webpage", e)
         else:
             self.logger.error("get_temp_and_feels_temp", "can't get temperature")
+        metrics.increment("weather_errors")
 
         return None, None
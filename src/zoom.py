@@ -1,7 +1,10 @@
 from typing import Tuple
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from enum import Enum
 from src.logger import Logger
+from src.zoom_pyramid import TileRenderer, build_pyramid
+import src.helper as hlpr
 
 
 class ZoomNavigationDirections(Enum):
@@ -34,9 +37,17 @@ class ZoomLevels(Enum):
 
 class Zoom:
     NAVIGATION_OFFSET = 15
+    RENDER_BUDGET_MS = 60
+    MAX_TILES = 96
 
     def __init__(self) -> None:
         self.logger = Logger(self.__class__.__name__)
+        self.renderer = TileRenderer(self.MAX_TILES, self.RENDER_BUDGET_MS)
+        self._generation = 0
+        # one build at a time, builds of previous images are cancelled
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="zoom_pyramid")
+        self._pending_levels = None
+        self._is_building = False
         self.reset()
 
     def __set_next_zoomLevel(self, is_zoom: bool):
@@ -54,13 +65,38 @@ class Zoom:
         elif i < len(zooms) - 1:
             self.zoomLevel = zooms[i + 1]
 
-    def init(self, img_array):
+    def init(self, img_array, source_path: str = None):
+        """
+            :param img_array: image fitted to screen
+            :param source_path: original image, its pyramid is built in background
+        """
         self.reset()
         if not img_array is None and img_array.any():
             self.imageArray = img_array
             self.imgHeight = img_array.shape[0]
             self.imgWidth = img_array.shape[1]
+            self.renderer.set_levels([(1.0, img_array)])
             self.isReady = True
+            if source_path:
+                self._is_building = True
+                self._executor.submit(self.__build_pyramid, source_path, img_array, self._generation)
+
+    def __build_pyramid(self, source_path, img_array, generation):
+        def is_cancelled():
+            return generation != self._generation
+
+        if is_cancelled():
+            # zoom reset or image changed while waiting for the previous build
+            return
+        levels = None
+        try:
+            original = np.asarray(hlpr.open_image_oriented(source_path).convert("RGB"))
+            levels = build_pyramid(original, img_array.shape[1], img_array.shape[0], img_array, is_cancelled)
+        except Exception as e:
+            self.logger.error("__build_pyramid", f"error building pyramid[{source_path}]", e)
+        if generation == self._generation:
+            self._pending_levels = levels
+            self._is_building = False
 
     def _reset_properties(self):
         self.zoomLevel = ZoomLevels.NO_ZOOM
@@ -78,6 +114,10 @@ class Zoom:
         return self.imgHeight
 
     def reset(self) -> None:
+        self._generation += 1
+        self._pending_levels = None
+        self._is_building = False
+        self.renderer.clear()
         self._reset_properties()
 
     def _set_zoom_level(self, action: ZoomAction) -> None:
@@ -139,6 +179,15 @@ class Zoom:
 
         return coordX, coordY
 
+    def __get_view(self, action: ZoomAction, direction: ZoomNavigationDirections):
+        """
+            Returns (minX, maxX), (minY, maxY) of the view, after zoom action and navigation
+        """
+        self._set_zoom_level(action)
+        navOffsets = self._get_next_navigation_offsets(direction)
+        minMaxX, minMaxY = self._get_coordinates_cropped(navOffsets)
+        return self.__handle_navigation_offset_overflow(minMaxX, minMaxY, navOffsets)
+
     def set_zoom(self, action: ZoomAction, direction: ZoomNavigationDirections) -> None:
         """
             :param action: Zoom/Dezoom
@@ -147,12 +196,31 @@ class Zoom:
             Rreturns cropped image array
         """
         if not self.imageArray is None and len(self.imageArray) > 0:
-            self._set_zoom_level(action)
-            navOffsets = self._get_next_navigation_offsets(direction)
-            minMaxX, minMaxY = self._get_coordinates_cropped(navOffsets)
-            minMaxX, minMaxY = self.__handle_navigation_offset_overflow(minMaxX, minMaxY, navOffsets)
+            minMaxX, minMaxY = self.__get_view(action, direction)
             return self.imageArray[minMaxY[0]:minMaxY[1], minMaxX[0]:minMaxX[1]]
         else:
             self.logger.warning("set_zoom", "imageArray not set or empty")
 
         return np.array([], dtype=np.uint8)
+
+    def render_zoom(self, action: ZoomAction, direction: ZoomNavigationDirections):
+        """
+            :param action: Zoom/Dezoom
+            :param direction: direction navigation
+
+            Returns (image array of width x height, complete) rendered from the image pyramid
+            complete is False while pyramid is building or if render budget was exceeded,
+            render_zoom(None, None) renders the same view again in better quality
+        """
+        if self.imageArray is None or len(self.imageArray) == 0:
+            self.logger.warning("render_zoom", "imageArray not set or empty")
+            return None, True
+        if self._pending_levels:
+            self.renderer.set_levels(self._pending_levels)
+            self._pending_levels = None
+        minMaxX, minMaxY = self.__get_view(action, direction)
+        scale_x = self.imgWidth / max(1, minMaxX[1] - minMaxX[0])
+        scale_y = self.imgHeight / max(1, minMaxY[1] - minMaxY[0])
+        view, complete = self.renderer.render(self.zoomLevel, minMaxX[0], minMaxY[0], scale_x, scale_y,
+                                              self.imgWidth, self.imgHeight)
+        return view, complete and not self._is_building
@@ -0,0 +1,120 @@
+from collections import OrderedDict
+from time import monotonic
+import numpy as np
+
+
+def build_pyramid(original, base_width: int, base_height: int, base_array=None, is_cancelled=None):
+    """
+        :param original: image array at full resolution
+        :param base_array: image array at base size (fitted to screen), optional
+        :param is_cancelled: function checked between levels, None is returned once it returns True
+
+        Returns levels [(scale, array)], scale relative to base size, from full resolution to base size
+    """
+    import cv2
+    levels = []
+    level = original
+    scale = level.shape[1] / base_width
+    while scale > 1:
+        if is_cancelled and is_cancelled():
+            return None
+        levels.append((scale, level))
+        if scale / 2 <= 1:
+            break
+        level = cv2.resize(level, (max(1, level.shape[1] // 2), max(1, level.shape[0] // 2)),
+                           interpolation=cv2.INTER_AREA)
+        scale = level.shape[1] / base_width
+    if base_array is None:
+        base_array = cv2.resize(original, (base_width, base_height), interpolation=cv2.INTER_AREA)
+    levels.append((1.0, base_array))
+    return levels
+
+
+class TileRenderer:
+    """
+        Renders a zoomed view of an image pyramid from cached tiles
+
+        Tiles are TILE_SIZE squares of the view at a given zoom, so panning
+        only renders the tiles coming into view. When the render budget is
+        exceeded, missing tiles are rendered from the smallest level and not cached.
+    """
+    TILE_SIZE = 256
+
+    def __init__(self, max_tiles: int = 96, budget_ms: int = 60) -> None:
+        self.max_tiles = max_tiles
+        self.budget_s = budget_ms / 1000
+        self._levels = []
+        self._tiles = OrderedDict()
+        self._out = None
+
+    def set_levels(self, levels):
+        self._levels = levels
+        self._tiles.clear()
+
+    def clear(self):
+        self._levels = []
+        self._tiles.clear()
+        self._out = None
+
+    def __get_level_index(self, zoom_scale):
+        """
+            Returns smallest level having at least as many pixels as the output
+        """
+        for i in range(len(self._levels) - 1, -1, -1):
+            if self._levels[i][0] >= zoom_scale:
+                return i
+        return 0
+
+    def __render_tile(self, level_index, scale_x, scale_y, tile_x, tile_y):
+        import cv2
+        level_scale, level = self._levels[level_index]
+        # output pixels per level pixel
+        ratio_x, ratio_y = scale_x / level_scale, scale_y / level_scale
+        size = self.TILE_SIZE
+        m = np.float32([[1 / ratio_x, 0, tile_x * size / ratio_x],
+                        [0, 1 / ratio_y, tile_y * size / ratio_y]])
+        return cv2.warpAffine(level, m, (size, size), flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                              borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+
+    def render(self, zoom_key, x0: float, y0: float, scale_x: float, scale_y: float, out_width: int,
+               out_height: int):
+        """
+            :param zoom_key: identifies scale_x, scale_y (zoom level)
+            :param x0, y0: view origin in base coordinates
+            :param scale_x, scale_y: output pixels per base pixel
+
+            Returns (view array, complete), complete is False if some tiles were rendered in low quality
+        """
+        if not self._levels:
+            return None, True
+        start = monotonic()
+        channels = self._levels[-1][1].shape[2] if self._levels[-1][1].ndim == 3 else 1
+        shape = (out_height, out_width, channels) if channels > 1 else (out_height, out_width)
+        if self._out is None or self._out.shape != shape:
+            self._out = np.zeros(shape, dtype=np.uint8)
+        out = self._out
+        level_index = self.__get_level_index(max(scale_x, scale_y))
+        size = self.TILE_SIZE
+        origin_x, origin_y = int(round(x0 * scale_x)), int(round(y0 * scale_y))
+        complete = True
+        for tile_y in range(origin_y // size, (origin_y + out_height - 1) // size + 1):
+            for tile_x in range(origin_x // size, (origin_x + out_width - 1) // size + 1):
+                key = (zoom_key, level_index, tile_x, tile_y)
+                tile = self._tiles.get(key)
+                if tile is not None:
+                    self._tiles.move_to_end(key)
+                elif monotonic() - start < self.budget_s:
+                    tile = self.__render_tile(level_index, scale_x, scale_y, tile_x, tile_y)
+                    self._tiles[key] = tile
+                    if len(self._tiles) > self.max_tiles:
+                        self._tiles.popitem(last=False)
+                else:
+                    # over budget: low quality tile from the smallest level, not cached
+                    tile = self.__render_tile(len(self._levels) - 1, scale_x, scale_y, tile_x, tile_y)
+                    complete = False
+                # part of the tile inside the view
+                left, top = tile_x * size - origin_x, tile_y * size - origin_y
+                dst_x0, dst_y0 = max(0, left), max(0, top)
+                dst_x1, dst_y1 = min(out_width, left + size), min(out_height, top + size)
+                out[dst_y0:dst_y1, dst_x0:dst_x1] = tile[dst_y0 - top:dst_y1 - top, dst_x0 - left:dst_x1 - left]
+        return out, complete